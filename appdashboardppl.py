@@ -1,11 +1,25 @@
 import streamlit as st
 import pandas as pd
-import datetime
+import hashlib
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
-from matplotlib.ticker import MaxNLocator
-from matplotlib import cm  # Para usar mapas de color monocromáticos
+import shutil
+import uuid
+
+from ppl_analytics import (ACTIVITY_TYPES, DASHBOARD_COLUMNS, DEFAULT_SHEET_NAME, HLL_STANDARD_ERROR,
+                           PRODUCTIVITY_DATASET_DIR, PRODUCTIVITY_FILE, RANKING_METRICS, TIME_GRANULARITIES,
+                           append_to_dataset, apply_schema, build_activity_cube, build_classification_facets,
+                           build_dataset_patient_index, build_unified_activity, choose_granularity,
+                           classification_activity_totals, classification_breakdown, dataset_facets_dir,
+                           ensure_data_dir, facet_classifications, file_version, load_dataframe,
+                           load_dataset_facets, load_facets, load_patient_index, load_prepared_upload,
+                           patient_index_path, patient_timeline, rank_professionals, read_date_bounds,
+                           rollup_activity_counts, save_facets, save_patient_index, store_upload_cache,
+                           upload_cache_path, upload_facets_path)
+from ppl_backends import QUERY_BACKEND, DuckDBBackend, PandasBackend
+from ppl_ingest import IngestQueue
+from ppl_charts import (chart_key, figure_to_png, plot_classification_breakdown, plot_daily_activity,
+                        plot_professional_ranking)
+from ppl_profiling import StageProfiler, append_profile_log
 
 # --- Configuración de la página ---
 st.set_page_config(
@@ -14,112 +28,311 @@ st.set_page_config(
     layout="wide"
 )
 
-# --- Configuración de Estilo de Gráficas (GENERAL) ---
-# Este estilo se aplicará a todos los gráficos EXCEPTO al de Evolución Diaria
-# que tendrá su estilo personalizado.
-sns.set_style("darkgrid")
-plt.rcParams['font.size'] = 12
-plt.rcParams['axes.titlesize'] = 16
-plt.rcParams['axes.labelsize'] = 14
-plt.rcParams['xtick.labelsize'] = 10
-plt.rcParams['ytick.labelsize'] = 10
-plt.rcParams['legend.fontsize'] = 12
+# Perfil de esta ejecución: cada etapa con nombre registra tiempo, filas y variación de memoria
+profiler = StageProfiler()
 
-# 1. Configuración de Persistencia de Datos
-PERSISTED_DATA_DIR = "../persisted_data"
-os.makedirs(PERSISTED_DATA_DIR, exist_ok=True)
-
-# Nombre de archivo para el DataFrame persistente
-PRODUCTIVITY_FILE = os.path.join(PERSISTED_DATA_DIR, "df_productivity.parquet")
+# 1. Configuración de Persistencia de Datos (las etapas del pipeline viven en ppl_analytics)
+ensure_data_dir()
 
 # 2. Inicializar st.session_state
 if 'productivity_uploaded' not in st.session_state:
     st.session_state.productivity_uploaded = False
-if 'df_productivity' not in st.session_state:
-    st.session_state.df_productivity = None
+# La sesión sólo guarda una referencia versionada al conjunto de datos compartido (ver get_shared_dataset)
+if 'dataset_ref' not in st.session_state:
+    st.session_state.dataset_ref = None
+if 'persisted_source' not in st.session_state:
+    st.session_state.persisted_source = None
+if 'loaded_window' not in st.session_state:
+    st.session_state.loaded_window = None
+if 'date_bounds' not in st.session_state:
+    st.session_state.date_bounds = None
+# Ingesta en segundo plano: claves de los trabajos en curso, archivos ya enviados y errores del último intento
+if 'ingest_keys' not in st.session_state:
+    st.session_state.ingest_keys = None
+if 'ingest_signature' not in st.session_state:
+    st.session_state.ingest_signature = None
+if 'ingest_errors' not in st.session_state:
+    st.session_state.ingest_errors = []
+# Identificador corto para agrupar en el registro de rendimiento los perfiles de una misma sesión
+if 'profile_session_id' not in st.session_state:
+    st.session_state.profile_session_id = uuid.uuid4().hex[:8]
+
+
+# 3. Funciones de la página sobre el núcleo de análisis
+def finish_profiling():
+    """
+    Cierra el perfil de la ejecución: lo agrega al registro JSON y, si está activado, lo muestra
+    en el panel "Rendimiento" de la barra lateral. Sólo actúa una vez por ejecución.
+    """
+    if profiler.finished:
+        return
+    profiler.finished = True
+    profile = profiler.summary()
+    append_profile_log(profile, session=st.session_state.profile_session_id)
+    st.sidebar.markdown("---")
+    if st.sidebar.checkbox("Mostrar panel de Rendimiento", key="show_profile_panel"):
+        with st.sidebar.expander("Rendimiento", expanded=True):
+            st.markdown(f"**Total de la ejecución:** {profile['total_s']:.3f} s")
+            if profile['rss_mb'] is not None:
+                st.markdown(f"**Memoria del proceso:** {profile['rss_mb']:.1f} MB")
+            if profile['etapas']:
+                st.dataframe(pd.DataFrame(profile['etapas']).set_index('etapa'))
+
+
+def stop_page():
+    """st.stop() registrando antes el perfil de la ejecución."""
+    finish_profiling()
+    st.stop()
 
 
-# 3. Funciones para guardar y cargar DataFrames con Parquet
-def save_dataframe(df, filepath):
-    """Guarda un DataFrame en un archivo Parquet."""
-    filename = os.path.basename(filepath)
+def save_dataframe(df, dataset_dir):
+    """Guarda un DataFrame en el conjunto Parquet particionado, agregando sólo las filas nuevas."""
+    dataset_name = os.path.basename(dataset_dir)
     if df is not None and not df.empty:
         try:
-            df.to_parquet(filepath, index=False)
-            st.info(f"💾 Guardado exitoso: {filename}")
+            df_added = append_to_dataset(df, dataset_dir)
+            st.info(f"💾 Guardado exitoso en {dataset_name}: {len(df_added)} novedades nuevas o completadas "
+                    f"con su auditoría.")
             return True
         except Exception as e:
-            st.error(f"❌ Error al guardar el archivo {filename}: {e}")
+            st.error(f"❌ Error al guardar en {dataset_name}: {e}")
             return False
     else:
-        st.info(f"ℹ️ No hay datos para guardar en {filename}. (DataFrame vacío o None)")
+        st.info(f"ℹ️ No hay datos para guardar en {dataset_name}. (DataFrame vacío o None)")
         return True
 
 
-def load_dataframe(filepath):
-    """Carga un DataFrame desde un archivo Parquet."""
-    if os.path.exists(filepath):
-        try:
-            df_loaded = pd.read_parquet(filepath)
-            string_cols_to_convert_on_load = ['RESPONSABLE DEL REGISTRO', 'IDENTIFICACIÓN DEL PPL',
-                                              'CLASIFICACION DE NOVEDAD', 'SEGUNDO APELLIDO', 'PRIMER NOMBRE',
-                                              'SEGUNDO NOMBRE', 'PRIMER APELLIDO', 'RESPONSABLE AUDITORIA']
-            for col in string_cols_to_convert_on_load:
-                if col in df_loaded.columns:
-                    df_loaded[col] = df_loaded[col].fillna('').astype(str)
-            return df_loaded
-        except Exception as e:
-            st.warning(f"No se pudo cargar el archivo {os.path.basename(filepath)} previamente guardado. "
-                       f"Por favor, súbelo de nuevo o verifica el archivo. Error: {e}")
-            return None
-    return None
+def load_saved_dataframe(filepath, columns=None, date_range=None):
+    """load_dataframe con el aviso de la página si el archivo persistido no se puede leer."""
+    try:
+        return load_dataframe(filepath, columns=columns, date_range=date_range)
+    except Exception as e:
+        st.warning(f"No se pudo cargar el archivo {os.path.basename(filepath)} previamente guardado. "
+                   f"Por favor, súbelo de nuevo o verifica el archivo. Error: {e}")
+        return None
 
 
-# 4. Función para cargar archivos subidos (con caché para eficiencia)
-@st.cache_data
-def load_uploaded_data(uploaded_file):
+def read_upload(uploaded_file, sheet_name):
     """
-    Carga un archivo CSV o Excel en un DataFrame de Pandas.
-    Maneja errores y retorna None si la carga falla.
+    load_prepared_upload sobre un archivo del file_uploader. Muestra el error y retorna
+    (None, [], None) si el archivo no se puede leer.
     """
-    if uploaded_file is not None:
-        try:
-            uploaded_file.seek(0)
+    try:
+        return load_prepared_upload(uploaded_file.getvalue(), uploaded_file.name, sheet_name)
+    except Exception as e:
+        st.error(f"Error al cargar el archivo (hoja '{sheet_name}' si es Excel). Asegúrate de que sea un archivo "
+                 f"CSV o Excel válido y de que la hoja exista y esté bien escrita. Detalles: {e}")
+        return None, [], None
+
+
+@st.cache_resource(show_spinner=False)
+def get_ingest_queue():
+    """Cola de ingesta compartida por el proceso: sobrevive a la recarga del navegador."""
+    return IngestQueue()
+
+
+def current_ingest_jobs():
+    """Trabajos de ingesta de la sesión, o None si alguno ya no está en el registro."""
+    jobs = [get_ingest_queue().get(key) for key in st.session_state.ingest_keys]
+    return None if any(job is None for job in jobs) else jobs
+
+
+@st.fragment(run_every=1.0)
+def show_ingest_progress():
+    """Muestra el progreso de cada archivo y vuelve a ejecutar la página cuando todos terminan."""
+    jobs = current_ingest_jobs()
+    if jobs is None or all(job.done for job in jobs):
+        st.rerun()
+    for job in jobs:
+        st.progress(job.fraction, text=f"{job.label}: {job.message}")
+
+
+def finish_ingest(jobs):
+    """
+    Cierra una ingesta terminada: si todos los archivos se convirtieron, la sesión apunta al
+    archivo (o a la combinación de todos, registrada en la caché compartida); si no, guarda los errores.
+    """
+    st.session_state.ingest_keys = None
+    # La lectura de cada archivo ocurrió en segundo plano: se registra en el perfil de esta ejecución
+    for job in jobs:
+        if job.stage is not None:
+            profiler.record_stage(job.stage)
+    errors = []
+    for job in jobs:
+        if job.error:
+            errors.append(f"Error al cargar {job.label}. Asegúrate de que sea un archivo CSV o Excel válido y de "
+                          f"que la hoja exista y esté bien escrita. Detalles: {job.error}")
+        elif job.missing_cols:
+            errors.append(f"❌ Error: Las siguientes columnas requeridas no se encontraron en {job.label}: "
+                          f"**{', '.join(job.missing_cols)}**.")
+    if errors:
+        st.session_state.ingest_errors = errors
+        return False
+
+    upload_key = jobs[0].key
+    if len(jobs) > 1:
+        upload_key = hashlib.sha256('+'.join(job.key for job in jobs).encode()).hexdigest()
+        if not os.path.exists(upload_cache_path(upload_key)):
+            df_combined = pd.concat([pd.read_parquet(upload_cache_path(job.key)) for job in jobs], ignore_index=True)
+            if not store_upload_cache(apply_schema(df_combined), upload_key):
+                st.session_state.ingest_errors = [
+                    "❌ No se pudo registrar la combinación de archivos en la caché compartida. "
+                    "Verifica el espacio en disco."]
+                return False
+    st.session_state.productivity_uploaded = True
+    st.session_state.dataset_ref = ('upload', upload_key)
+    st.session_state.persisted_source = None
+    st.session_state.loaded_window = None
+    st.session_state.date_bounds = None
+    return True
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_activity_cube(_df, dataset_ref, approximate=False):
+    """Cubo de agregados compartido, construido una sola vez por versión del conjunto de datos y modo de conteo."""
+    return build_activity_cube(build_unified_activity(_df), approximate=approximate)
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_duckdb_backend(source, version, approximate=False):
+    """Motor DuckDB compartido sobre un archivo o conjunto Parquet; 'version' invalida la entrada al cambiar."""
+    return DuckDBBackend(source, approximate=approximate)
+
+
+def parquet_source(dataset_ref):
+    """Parquet de la versión de datos y su versión: el histórico persistido o la caché de conversión del archivo subido."""
+    if dataset_ref[0] == 'persisted':
+        return dataset_ref[1], dataset_ref[2]
+    return upload_cache_path(dataset_ref[1]), dataset_ref[1]
+
+
+def get_query_backend(df, dataset_ref, approximate=False):
+    """
+    Motor de consultas de la página para la versión del conjunto de datos (ver ppl_backends).
+    Con PPL_QUERY_BACKEND=duckdb se consulta directamente el Parquet persistido o la caché de
+    conversión del archivo subido; si no, el cubo de agregados en memoria. 'approximate'
+    estima los pacientes únicos con HyperLogLog en lugar de contarlos exactamente.
+    """
+    if QUERY_BACKEND == 'duckdb':
+        return get_duckdb_backend(*parquet_source(dataset_ref), approximate)
+    return PandasBackend(get_activity_cube(df, dataset_ref, approximate))
+
+
+def patient_index_ref(dataset_ref):
+    """
+    Versión de datos que abarca el índice de pacientes: todo el histórico persistido
+    ('persisted', origen, versión), sin importar la ventana de fechas cargada, o el archivo subido.
+    """
+    return dataset_ref[:3] if dataset_ref[0] == 'persisted' else dataset_ref
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_patient_index(index_ref):
+    """
+    Índice paciente -> filas de una versión de datos (patient_index_ref), construido sobre
+    el Parquet (histórico o caché de conversión) leyendo sólo la identificación. Se lee del
+    disco si ya se construyó antes (en este u otro proceso); si no, se construye y se persiste.
+    """
+    index_path = patient_index_path(index_ref)
+    index = load_patient_index(index_path) if os.path.exists(index_path) else None
+    # Los índices guardados antes de leer el historial desde el Parquet no tienen 'files'
+    if index is None or 'files' not in index:
+        index = build_dataset_patient_index(parquet_source(index_ref)[0])
+        save_patient_index(index, index_path)
+    return index
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_classification_facets(_df, dataset_ref):
+    """
+    Conteos por día, profesional, clasificación y tipo de actividad de la versión del conjunto
+    de datos, calculados al ingerir: en el histórico se combinan las facetas por partición de
+    los meses de la ventana; las de un archivo subido se guardan con su caché de conversión.
+    Si éstas faltan (p. ej. descartadas por la caché) se recalculan desde 'df' o, con DuckDB
+    (df None), sobre el Parquet.
+    """
+    if dataset_ref[0] == 'persisted':
+        _, source, _, start_date, end_date = dataset_ref
+        return load_dataset_facets(source, (start_date, end_date))
+    path = upload_facets_path(dataset_ref[1])
+    facets = load_facets(path) if os.path.exists(path) else None
+    if facets is None:
+        facets = (build_classification_facets(_df) if _df is not None
+                  else get_duckdb_backend(*parquet_source(dataset_ref)).classification_facets())
+        save_facets(facets, path)
+    return facets
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_shared_dataset(dataset_ref):
+    """
+    DataFrame de sólo lectura compartido por todas las sesiones del proceso. 'dataset_ref' es
+    ('persisted', origen, versión, inicio, fin) para una ventana del histórico o
+    ('upload', clave) para un archivo subido guardado en la caché de conversión.
+    Nadie debe modificar el DataFrame retornado: las sesiones sólo guardan la referencia.
+    """
+    if dataset_ref[0] == 'persisted':
+        _, source, _, start_date, end_date = dataset_ref
+        return load_saved_dataframe(source, columns=DASHBOARD_COLUMNS, date_range=(start_date, end_date))
+    cache_path = upload_cache_path(dataset_ref[1])
+    return pd.read_parquet(cache_path) if os.path.exists(cache_path) else None
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def render_professional_ranking(_ranking, metric, _others, image_key):
+    """PNG del gráfico de productividad; 'image_key' (chart_key) identifica los datos y el estilo."""
+    return figure_to_png(plot_professional_ranking(_ranking, metric, _others))
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def render_daily_activity(_daily, professional, granularity, image_key):
+    """PNG de la evolución de un profesional; una selección ya vista no vuelve a dibujarse."""
+    return figure_to_png(plot_daily_activity(_daily, professional, granularity))
 
-            try:
-                df_loaded = pd.read_csv(uploaded_file, encoding='utf-8', errors='ignore', on_bad_lines='skip')
-                return df_loaded
-            except Exception as csv_error:
-                uploaded_file.seek(0)
-                try:
-                    df_loaded = pd.read_excel(uploaded_file, sheet_name="NOVEDADES JULIO", engine='openpyxl')
-                    return df_loaded
-                except Exception as excel_error:
-                    st.error(f"Error al cargar la hoja 'NOVEDADES JULIO' del archivo Excel. Detalles: {excel_error}")
-                    st.error("Asegúrate de que la hoja exista y esté bien escrita.")
-                    return None
-        except Exception as e:
-            st.error(
-                f"Error general al cargar el archivo. Asegúrate de que sea un archivo CSV o Excel válido. Detalles: {e}")
-            return None
-    return None
-
-
-# 5. Cargar datos persistentes al inicio si existen
-if not st.session_state.productivity_uploaded and os.path.exists(PRODUCTIVITY_FILE):
-    st.session_state.df_productivity = load_dataframe(PRODUCTIVITY_FILE)
-    if st.session_state.df_productivity is not None:
-        string_cols_to_convert_on_load_state = ['RESPONSABLE DEL REGISTRO', 'IDENTIFICACIÓN DEL PPL',
-                                                'CLASIFICACION DE NOVEDAD', 'SEGUNDO APELLIDO', 'PRIMER NOMBRE',
-                                                'SEGUNDO NOMBRE', 'PRIMER APELLIDO', 'RESPONSABLE AUDITORIA']
-        for col in string_cols_to_convert_on_load_state:
-            if col in st.session_state.df_productivity.columns:
-                st.session_state.df_productivity[col] = st.session_state.df_productivity[col].fillna('').astype(str)
-
-        if 'FECHA DE REGISTRO DE NOVEDAD' in st.session_state.df_productivity.columns:
-            st.session_state.df_productivity['FECHA DE REGISTRO DE NOVEDAD'] = pd.to_datetime(
-                st.session_state.df_productivity['FECHA DE REGISTRO DE NOVEDAD'], errors='coerce')
 
+@st.cache_data(show_spinner=False, max_entries=64)
+def render_classification_breakdown(_breakdown, title, x_label, image_key):
+    """PNG de un desglose apilado por clasificación de novedad."""
+    return figure_to_png(plot_classification_breakdown(_breakdown, title, x_label))
+
+
+def current_dataset():
+    """DataFrame compartido al que apunta la sesión actual, o None."""
+    if st.session_state.dataset_ref is None:
+        return None
+    return get_shared_dataset(st.session_state.dataset_ref)
+
+
+def load_persisted_window(source, window):
+    """
+    Apunta la sesión a una ventana de fechas del histórico persistido (sólo las columnas del
+    dashboard). Con DuckDB las consultas leen el Parquet y la ventana no se carga en pandas.
+    """
+    dataset_ref = ('persisted', source, file_version(source), window[0], window[1])
+    if QUERY_BACKEND != 'duckdb' and get_shared_dataset(dataset_ref) is None:
+        return False
+    st.session_state.dataset_ref = dataset_ref
+    st.session_state.persisted_source = source
+    st.session_state.loaded_window = window
+    return True
+
+
+# 5. Cargar datos persistentes al inicio si existen (conjunto particionado o archivo anterior)
+persisted_source = PRODUCTIVITY_DATASET_DIR if os.path.isdir(PRODUCTIVITY_DATASET_DIR) else PRODUCTIVITY_FILE
+if not st.session_state.productivity_uploaded and os.path.exists(persisted_source):
+    try:
+        persisted_bounds = read_date_bounds(persisted_source)
+    except Exception as e:
+        st.warning(f"No se pudo leer el histórico {os.path.basename(persisted_source)}. Error: {e}")
+        persisted_bounds = None
+    # Al inicio sólo se carga el último mes con datos; el resto se lee al ampliar el rango de fechas
+    with profiler.stage('carga del histórico') as stage:
+        persisted_loaded = persisted_bounds is not None and load_persisted_window(
+            persisted_source, (max(persisted_bounds[0], persisted_bounds[1].replace(day=1)), persisted_bounds[1]))
+        if persisted_loaded and QUERY_BACKEND != 'duckdb':
+            stage['filas'] = len(current_dataset())
+    if persisted_loaded:
+        st.session_state.date_bounds = persisted_bounds
         st.session_state.productivity_uploaded = True
         st.info("Archivo de productividad cargado desde persistencia.")
 
@@ -130,64 +343,105 @@ st.markdown("Sube tu archivo para analizar la productividad de los profesionales
 # 7. Carga del Archivo desde la barra lateral
 st.sidebar.header("Cargar Archivo")
 
+sheet_name_selected = st.sidebar.text_input("Hojas de Excel a cargar (separadas por coma)",
+                                            value=DEFAULT_SHEET_NAME, key="sheet_name_input")
+sheet_names_selected = ([name.strip() for name in sheet_name_selected.split(',') if name.strip()]
+                        or [DEFAULT_SHEET_NAME])
+
 if not st.session_state.productivity_uploaded:
-    uploaded_file_widget = st.sidebar.file_uploader(
-        "Sube tu archivo de Productividad (CSV/Excel)",
+    uploaded_file_widgets = st.sidebar.file_uploader(
+        "Sube tus archivos de Productividad (CSV/Excel)",
         type=["csv", "xlsx"],
+        accept_multiple_files=True,
         key="productivity_uploader"
     )
-    if uploaded_file_widget is not None:
-        df_new = load_uploaded_data(uploaded_file_widget)
-        if df_new is not None:
-            df_new.columns = df_new.columns.str.upper()
-
-            string_cols_to_convert = ['RESPONSABLE DEL REGISTRO', 'IDENTIFICACIÓN DEL PPL', 'CLASIFICACION DE NOVEDAD',
-                                      'SEGUNDO APELLIDO', 'PRIMER NOMBRE', 'SEGUNDO NOMBRE', 'PRIMER APELLIDO',
-                                      'RESPONSABLE AUDITORIA']
-            for col in string_cols_to_convert:
-                if col in df_new.columns:
-                    df_new[col] = df_new[col].fillna('').astype(str)
-
-            required_cols_for_check = {
-                'RESPONSABLE DEL REGISTRO': str,
-                'FECHA DE REGISTRO DE NOVEDAD': 'datetime',
-                'IDENTIFICACIÓN DEL PPL': str
-            }
-            if 'RESPONSABLE AUDITORIA' in df_new.columns:
-                required_cols_for_check['RESPONSABLE AUDITORIA'] = str
-
-            if 'CLASIFICACION DE NOVEDAD' in df_new.columns:
-                required_cols_for_check['CLASIFICACION DE NOVEDAD'] = str
-
-            missing_cols = [col for col in required_cols_for_check if col not in df_new.columns]
-            if missing_cols:
-                st.error(
-                    f"❌ Error: Las siguientes columnas requeridas no se encontraron en la hoja 'NOVEDADES JULIO': **{', '.join(missing_cols)}**.")
-                st.error(
-                    "Por favor, asegúrate de que tu archivo contenga estas columnas en la hoja especificada y vuelve a cargarlo.")
-                st.session_state.df_productivity = None
-                st.session_state.productivity_uploaded = False
-            else:
-                if 'FECHA DE REGISTRO DE NOVEDAD' in df_new.columns:
-                    df_new['FECHA DE REGISTRO DE NOVEDAD'] = pd.to_datetime(df_new['FECHA DE REGISTRO DE NOVEDAD'],
-                                                                            errors='coerce')
-                    df_new.dropna(subset=['FECHA DE REGISTRO DE NOVEDAD'], inplace=True)
-
-                st.session_state.productivity_uploaded = True
-                st.session_state.df_productivity = df_new
-                st.success("Archivo cargado y preprocesado correctamente desde la hoja 'NOVEDADES JULIO'.")
+    # Cada archivo (y cada hoja de los Excel) se ingiere en paralelo en segundo plano
+    upload_signature = (tuple(widget.file_id for widget in uploaded_file_widgets), tuple(sheet_names_selected))
+    if uploaded_file_widgets and upload_signature != st.session_state.ingest_signature:
+        ingest_queue = get_ingest_queue()
+        st.session_state.ingest_keys = [
+            ingest_queue.submit(widget.getvalue(), widget.name, sheet).key
+            for widget in uploaded_file_widgets
+            for sheet in (sheet_names_selected if widget.name.lower().endswith('.xlsx') else [None])
+        ]
+        st.session_state.ingest_signature = upload_signature
+        st.session_state.ingest_errors = []
+
+    if st.session_state.ingest_keys:
+        ingest_jobs = current_ingest_jobs()
+        if ingest_jobs is None:
+            # El registro descartó algún trabajo: se vuelven a enviar los archivos
+            st.session_state.ingest_keys = None
+            st.session_state.ingest_signature = None
+            st.rerun()
+        if all(job.done for job in ingest_jobs):
+            with profiler.stage('cierre de la ingesta', rows=sum(job.rows or 0 for job in ingest_jobs)):
+                ingested = finish_ingest(ingest_jobs)
+            if ingested:
+                st.success(f"{len(ingest_jobs)} archivo(s)/hoja(s) cargados y preprocesados correctamente.")
+                finish_profiling()
                 st.rerun()
         else:
-            st.error("Fallo al cargar el archivo.")
+            st.info("Procesando los archivos en segundo plano; puedes seguir usando la página.")
+            show_ingest_progress()
+
+    for ingest_error in st.session_state.ingest_errors:
+        st.error(ingest_error)
 else:
     st.sidebar.info("Archivo ya cargado (desde subida o persistencia).")
 
+    # Incorporación incremental de un nuevo mes al histórico persistido
+    monthly_file_widget = st.sidebar.file_uploader(
+        "Agregar archivo mensual al histórico (CSV/Excel)",
+        type=["csv", "xlsx"],
+        key="monthly_uploader"
+    )
+    if monthly_file_widget is not None and st.sidebar.button("Incorporar mes al histórico",
+                                                             key="append_month_button"):
+        with profiler.stage('lectura del archivo mensual') as stage:
+            df_month, missing_cols, month_key = read_upload(monthly_file_widget, sheet_names_selected[0])
+            stage['filas'] = None if df_month is None else len(df_month)
+        if df_month is not None:
+            if missing_cols:
+                st.sidebar.error(
+                    f"❌ Faltan columnas requeridas en la hoja '{sheet_names_selected[0]}': **{', '.join(missing_cols)}**.")
+            else:
+                try:
+                    with profiler.stage('incorporación al histórico') as stage:
+                        df_added = append_to_dataset(df_month, PRODUCTIVITY_DATASET_DIR)
+                        stage['filas'] = len(df_added)
+                except Exception as e:
+                    st.sidebar.error(f"❌ Error al incorporar el archivo mensual: {e}")
+                else:
+                    if not df_added.empty and st.session_state.loaded_window is not None:
+                        # Sesión respaldada por el histórico: se recargan sus límites y la ventana actual
+                        st.session_state.date_bounds = read_date_bounds(PRODUCTIVITY_DATASET_DIR)
+                        load_persisted_window(PRODUCTIVITY_DATASET_DIR, st.session_state.loaded_window)
+                    elif not df_added.empty:
+                        # Archivo subido sin guardar: la combinación se registra como una nueva entrada compartida
+                        combined_key = hashlib.sha256(
+                            f"{st.session_state.dataset_ref[1]}+{month_key}".encode()).hexdigest()
+                        if store_upload_cache(apply_schema(pd.concat([current_dataset(), df_added],
+                                                                     ignore_index=True)), combined_key):
+                            st.session_state.dataset_ref = ('upload', combined_key)
+                    st.sidebar.success(f"{len(df_added)} novedades nuevas o completadas con su auditoría; "
+                                       f"{len(df_month) - len(df_added)} ya existían en el histórico.")
+        else:
+            st.sidebar.error("Fallo al cargar el archivo mensual.")
+
 # 8. Botones de Acción: Guardar y Limpiar
 st.sidebar.markdown("---")
 st.sidebar.subheader("Acciones de Datos")
 
 if st.sidebar.button("Guardar datos para futura carga", key="save_data_button"):
-    if save_dataframe(st.session_state.df_productivity, PRODUCTIVITY_FILE):
+    if st.session_state.persisted_source == PRODUCTIVITY_FILE:
+        # Migración del archivo anterior: se guarda completo, no sólo la ventana cargada
+        df_to_save = load_saved_dataframe(PRODUCTIVITY_FILE)
+    else:
+        df_to_save = current_dataset()
+    with profiler.stage('guardado del histórico', rows=None if df_to_save is None else len(df_to_save)):
+        saved = save_dataframe(df_to_save, PRODUCTIVITY_DATASET_DIR)
+    if saved:
         st.sidebar.success("Datos procesados guardados correctamente.")
     else:
         st.sidebar.error("Hubo un error al guardar los datos.")
@@ -195,10 +449,20 @@ if st.sidebar.button("Guardar datos para futura carga", key="save_data_button"):
 
 def clear_uploaded_files():
     st.session_state.productivity_uploaded = False
-    st.session_state.df_productivity = None
+    st.session_state.ingest_keys = None
+    st.session_state.ingest_signature = None
+    st.session_state.ingest_errors = []
+    st.session_state.dataset_ref = None
+    st.session_state.persisted_source = None
+    st.session_state.loaded_window = None
+    st.session_state.date_bounds = None
     if os.path.exists(PRODUCTIVITY_FILE):
         os.remove(PRODUCTIVITY_FILE)
         st.sidebar.info(f"Archivo persistente {os.path.basename(PRODUCTIVITY_FILE)} eliminado.")
+    if os.path.isdir(PRODUCTIVITY_DATASET_DIR):
+        shutil.rmtree(PRODUCTIVITY_DATASET_DIR)
+        st.sidebar.info(f"Histórico persistente {os.path.basename(PRODUCTIVITY_DATASET_DIR)} eliminado.")
+    shutil.rmtree(dataset_facets_dir(PRODUCTIVITY_DATASET_DIR), ignore_errors=True)
     st.cache_data.clear()
     st.rerun()
 
@@ -206,26 +470,57 @@ def clear_uploaded_files():
 st.sidebar.button("Limpiar archivo cargado y persistente", on_click=clear_uploaded_files, key="clear_files_button")
 
 # *** VALIDACIÓN REFORZADA DE DATAFRAME ***
-df = st.session_state.df_productivity if st.session_state.df_productivity is not None else pd.DataFrame()
-
-if df.empty:
+# Con DuckDB las consultas, las facetas y el historial por PPL leen directamente el Parquet
+# (histórico o caché de conversión): las filas no se cargan en pandas y df queda en None
+if QUERY_BACKEND == 'duckdb':
+    df = None
+    dataset_missing = (st.session_state.dataset_ref is None
+                       or not os.path.exists(parquet_source(st.session_state.dataset_ref)[0]))
+else:
+    with profiler.stage('conjunto de datos') as stage:
+        df = current_dataset()
+        if df is None:
+            df = pd.DataFrame()
+        stage['filas'] = len(df)
+    dataset_missing = df.empty and st.session_state.loaded_window is None
+
+if dataset_missing:
     st.info(
         "Para comenzar el análisis, por favor **sube un archivo** usando el botón en la **barra lateral izquierda**, o **carga los datos guardados** si ya existen.")
-    st.stop()
+    stop_page()
 
 # 10. Filtro de Análisis (GLOBAL)
 st.sidebar.subheader("Filtros de Análisis")
-
-df_filtered_date = df.copy()
+approximate_patients = st.sidebar.checkbox(
+    "Pacientes únicos aproximados", key="approximate_patients",
+    help="Estima los pacientes únicos con sketches HyperLogLog en lugar de contarlos uno a uno: usa menos "
+         f"memoria en históricos muy grandes, con un error típico de ±{HLL_STANDARD_ERROR:.1%} "
+         f"(±{2 * HLL_STANDARD_ERROR:.1%} en el 95 % de los casos). Las actividades siempre son exactas.")
 
 # *** BLOQUE DE FILTRADO DE FECHAS ***
-if 'FECHA DE REGISTRO DE NOVEDAD' in df.columns:
-    min_date_global = df['FECHA DE REGISTRO DE NOVEDAD'].min().date()
-    max_date_global = df['FECHA DE REGISTRO DE NOVEDAD'].max().date()
+# El Parquet que consulta DuckDB sólo guarda conjuntos ya validados por prepare_productivity_frame
+if df is None or 'FECHA DE REGISTRO DE NOVEDAD' in df.columns:
+    if st.session_state.loaded_window is not None:
+        # Histórico persistido: los límites vienen de las estadísticas Parquet y sólo se carga la ventana elegida
+        min_date_global, max_date_global = st.session_state.date_bounds
+        default_date_range = st.session_state.loaded_window
+    else:
+        # --- MOTOR DE CONSULTAS (cubo construido una vez por versión de datos, o DuckDB sobre Parquet) ---
+        with profiler.stage(f'motor de consultas ({QUERY_BACKEND})', rows=None if df is None else len(df)):
+            query_backend = get_query_backend(df, st.session_state.dataset_ref, approximate_patients)
+            activity_bounds = query_backend.date_bounds()
+
+        if activity_bounds is None:
+            st.warning(
+                "No se encontraron profesionales de registro o auditoría para analizar en el archivo cargado.")
+            stop_page()
+
+        min_date_global, max_date_global = activity_bounds
+        default_date_range = (min_date_global, max_date_global)
 
     date_range_selection = st.sidebar.date_input(
         "Selecciona Rango de Fechas",
-        value=(min_date_global, max_date_global),
+        value=default_date_range,
         min_value=min_date_global,
         max_value=max_date_global,
         key="date_range_filter_global"
@@ -247,59 +542,56 @@ if 'FECHA DE REGISTRO DE NOVEDAD' in df.columns:
     if start_date > end_date:
         st.sidebar.error(
             "Error: La fecha de inicio no puede ser posterior a la fecha de fin. Por favor, corrige tu selección.")
-        st.stop()
-
-    df_filtered_date = df[
-        (df['FECHA DE REGISTRO DE NOVEDAD'].dt.date >= start_date) &
-        (df['FECHA DE REGISTRO DE NOVEDAD'].dt.date <= end_date)
-        ].copy()
-
-    if df_filtered_date.empty:
+        stop_page()
+
+    if st.session_state.loaded_window is not None:
+        window_start, window_end = st.session_state.loaded_window
+        if start_date < window_start or end_date > window_end:
+            with profiler.stage('ampliación de la ventana de fechas') as stage:
+                window_loaded = load_persisted_window(st.session_state.persisted_source, (start_date, end_date))
+                if window_loaded and df is not None:
+                    df = current_dataset()
+                    stage['filas'] = len(df)
+            if not window_loaded:
+                stop_page()
+        with profiler.stage(f'motor de consultas ({QUERY_BACKEND})', rows=None if df is None else len(df)):
+            query_backend = get_query_backend(df, st.session_state.dataset_ref, approximate_patients)
+
+    with profiler.stage('profesionales del rango') as stage:
+        professional_options_unified = query_backend.professionals(start_date, end_date)
+        stage['filas'] = len(professional_options_unified)
+
+    if not professional_options_unified:
         st.warning("No hay datos disponibles para el rango de fechas seleccionado. Por favor, ajusta los filtros.")
-        st.stop()
+        stop_page()
 
 else:
     st.error(
         "❌ Error crítico: La columna 'FECHA DE REGISTRO DE NOVEDAD' no se encontró en el archivo cargado. Asegúrate de que el nombre sea **exacto** y la columna exista.")
-    st.stop()
-
-# --- PREPARACIÓN DE DATOS PARA ANÁLISIS UNIFICADO ---
-unified_data = []
-
-for index, row in df_filtered_date.iterrows():
-    if 'RESPONSABLE DEL REGISTRO' in row and pd.notna(row['RESPONSABLE DEL REGISTRO']) and row[
-        'RESPONSABLE DEL REGISTRO'] != '':
-        unified_data.append({
-            'Profesional': row['RESPONSABLE DEL REGISTRO'],
-            'Tipo_Actividad': 'Registro',
-            'IDENTIFICACIÓN DEL PPL': row['IDENTIFICACIÓN DEL PPL'],
-            'FECHA DE REGISTRO DE NOVEDAD': row['FECHA DE REGISTRO DE NOVEDAD']
-        })
-
-    if 'RESPONSABLE AUDITORIA' in row and pd.notna(row['RESPONSABLE AUDITORIA']) and row['RESPONSABLE AUDITORIA'] != '':
-        unified_data.append({
-            'Profesional': row['RESPONSABLE AUDITORIA'],
-            'Tipo_Actividad': 'Auditoría',
-            'IDENTIFICACIÓN DEL PPL': row['IDENTIFICACIÓN DEL PPL'],
-            'FECHA DE REGISTRO DE NOVEDAD': row['FECHA DE REGISTRO DE NOVEDAD']
-        })
-
-if unified_data:
-    df_unified = pd.DataFrame(unified_data)
-    df_unified['Profesional'] = df_unified['Profesional'].astype(str)
-    df_unified['IDENTIFICACIÓN DEL PPL'] = df_unified['IDENTIFICACIÓN DEL PPL'].astype(str)
-else:
-    df_unified = pd.DataFrame(
-        columns=['Profesional', 'Tipo_Actividad', 'IDENTIFICACIÓN DEL PPL', 'FECHA DE REGISTRO DE NOVEDAD'])
-    st.warning(
-        "No se encontraron profesionales de registro o auditoría para analizar en el rango de fechas seleccionado.")
-    st.stop()
+    stop_page()
+
+# --- HISTORIAL POR PPL (índice invertido, independiente de los filtros) ---
+with st.expander("🔎 Historial de actividad por PPL"):
+    patient_query = st.text_input("Identificación del PPL", key="patient_lookup").strip()
+    if patient_query:
+        with profiler.stage('índice de pacientes') as stage:
+            patient_index = get_patient_index(patient_index_ref(st.session_state.dataset_ref))
+            stage['filas'] = int(patient_index['positions'].size)
+        with profiler.stage('historial del PPL') as stage:
+            # Las filas del paciente se leen del Parquet, no de la ventana de fechas cargada
+            df_patient_timeline = patient_timeline(None, patient_index, patient_query)
+            stage['filas'] = len(df_patient_timeline)
+        if df_patient_timeline.empty:
+            st.info(f"No hay registros ni auditorías para el PPL {patient_query} en los datos cargados.")
+        else:
+            st.markdown(f"**Registros y auditorías del PPL {patient_query}:** {len(df_patient_timeline)} actividades.")
+            st.dataframe(df_patient_timeline, hide_index=True)
+        if st.session_state.loaded_window is not None:
+            st.caption("Con el histórico persistido la búsqueda abarca todo el histórico, no sólo el rango cargado.")
 
 # --- FILTRO DE PROFESIONAL (UNIFICADO) ---
-professional_options_unified = df_unified['Profesional'].dropna().unique()
-
-if professional_options_unified.size > 0:
-    professional_options = ['Todos'] + sorted(list(professional_options_unified))
+if professional_options_unified:
+    professional_options = ['Todos'] + professional_options_unified
     professional_seleccionado = st.sidebar.multiselect(
         'Filtrar por Profesional:',
         options=professional_options,
@@ -321,14 +613,35 @@ else:
     professional_seleccionado = ['Todos']
     is_single_professional_selected = False
 
-if 'Todos' not in professional_seleccionado:
-    df_filtered_unified = df_unified[df_unified['Profesional'].isin(professional_seleccionado)].copy()
-else:
-    df_filtered_unified = df_unified.copy()
-
-if df_filtered_unified.empty:
+selected_professionals_filter = None if 'Todos' in professional_seleccionado else professional_seleccionado
+
+# --- FILTRO DE CLASIFICACIÓN DE NOVEDAD (facetas precalculadas por versión de datos) ---
+with profiler.stage('facetas de clasificación', rows=None if df is None else len(df)) as stage:
+    classification_facets = get_classification_facets(df, st.session_state.dataset_ref)
+    classification_options = facet_classifications(classification_facets, start_date, end_date,
+                                                   selected_professionals_filter)
+    stage['filas'] = len(classification_facets)
+classification_seleccionada = st.sidebar.multiselect(
+    'Filtrar por Clasificación de Novedad:',
+    options=['Todas'] + classification_options,
+    default=['Todas'],
+    key="filter_classification",
+    help="Aplica al desglose por clasificación, junto con las fechas y los profesionales seleccionados."
+)
+if 'Todas' in classification_seleccionada and len(classification_seleccionada) > 1:
+    classification_seleccionada = ['Todas']
+    st.sidebar.info("Cuando 'Todas' está seleccionado, se ignoran las otras clasificaciones.")
+elif not classification_seleccionada:
+    classification_seleccionada = ['Todas']
+selected_classifications_filter = None if 'Todas' in classification_seleccionada else classification_seleccionada
+with profiler.stage('resumen por profesional') as stage:
+    df_patients_per_professional_unified = query_backend.summary(start_date, end_date,
+                                                                   selected_professionals_filter)
+    stage['filas'] = len(df_patients_per_professional_unified)
+
+if df_patients_per_professional_unified.empty:
     st.warning("No hay datos disponibles para la combinación de filtros seleccionada. Por favor, ajusta los filtros.")
-    st.stop()
+    stop_page()
 
 # --- CONDICIONAL PARA MOSTRAR GRÁFICO UNIFICADO O SÓLO EL DETALLE ---
 if not is_single_professional_selected:
@@ -338,46 +651,46 @@ if not is_single_professional_selected:
     st.markdown(
         "Aquí puedes ver la productividad consolidada de los profesionales, basada en los pacientes que han **registrado o auditado**.")
 
-    df_patients_per_professional_unified = df_filtered_unified.groupby('Profesional').agg(
-        pacientes_unicos_total=('IDENTIFICACIÓN DEL PPL', 'nunique'),
-        actividades_totales=('IDENTIFICACIÓN DEL PPL', 'count')
-    ).reset_index()
-
-    df_patients_per_professional_unified['pacientes_unicos_total'] = df_patients_per_professional_unified[
-        'pacientes_unicos_total'].astype(int)
-    df_patients_per_professional_unified['actividades_totales'] = df_patients_per_professional_unified[
-        'actividades_totales'].astype(int)
+    # Ranking paginado: la tabla y el gráfico sólo muestran una página; el resto va en "Otros"
+    ranking_columns = st.columns(4)
+    ranking_metric = ranking_columns[0].selectbox("Ordenar por", options=list(RANKING_METRICS),
+                                                  format_func=RANKING_METRICS.get, key="ranking_metric")
+    ranking_ascending = ranking_columns[1].selectbox("Orden", options=[False, True],
+                                                     format_func=lambda ascending: ("Menor a mayor" if ascending
+                                                                                    else "Mayor a menor"),
+                                                     key="ranking_order")
+    ranking_page_size = int(ranking_columns[2].number_input("Profesionales por página", min_value=5,
+                                                            max_value=100, value=20, step=5,
+                                                            key="ranking_page_size"))
+    ranking_pages = -(-len(df_patients_per_professional_unified) // ranking_page_size)
+    ranking_page = min(int(ranking_columns[3].number_input(f"Página (de {ranking_pages})", min_value=1,
+                                                           value=1, key="ranking_page")), ranking_pages) - 1
+
+    with profiler.stage('ranking de profesionales', rows=len(df_patients_per_professional_unified)) as stage:
+        df_ranking_page = rank_professionals(df_patients_per_professional_unified, ranking_metric,
+                                             ranking_page_size, ranking_page, ranking_ascending)
+        others_professionals = df_patients_per_professional_unified.loc[
+            ~df_patients_per_professional_unified['Profesional'].isin(df_ranking_page['Profesional']), 'Profesional']
+        ranking_others = query_backend.others(start_date, end_date, others_professionals.tolist())
+        stage['filas'] = len(df_ranking_page)
 
     st.markdown("### Tabla de Pacientes Únicos y Actividades Totales por Profesional")
-    st.dataframe(df_patients_per_professional_unified.set_index('Profesional'))
+    st.dataframe(df_ranking_page.set_index('Profesional'))
+    if ranking_others is not None:
+        st.caption(f"Otros {ranking_others['profesionales']} profesionales fuera de esta página: "
+                   f"{ranking_others['pacientes_unicos_total']} pacientes únicos y "
+                   f"{ranking_others['actividades_totales']} actividades.")
+    if approximate_patients and QUERY_BACKEND == 'duckdb':
+        st.caption("Pacientes únicos aproximados (approx_count_distinct de DuckDB).")
+    elif approximate_patients:
+        st.caption(f"Pacientes únicos aproximados (HyperLogLog): error típico de ±{HLL_STANDARD_ERROR:.1%}.")
 
     # Generar el gráfico de barras unificado con colores monocromáticos
-    if not df_patients_per_professional_unified.empty:
-        # Este gráfico de barras mantiene el estilo "darkgrid" por defecto (global)
-        fig_unified, ax_unified = plt.subplots(figsize=(14, 7))
-
-        # Definir un mapa de color monocromático (ej. 'Greens', 'Blues', 'Purples', 'Oranges')
-        cmap = cm.get_cmap('Greens', len(df_patients_per_professional_unified) + 2)
-        colors = [cmap(i) for i in range(2, cmap.N)]
-
-        bars_unified = ax_unified.bar(df_patients_per_professional_unified['Profesional'],
-                                      df_patients_per_professional_unified['pacientes_unicos_total'],
-                                      color=colors)  # Asignar un color diferente a cada barra
-
-        ax_unified.set_title('Pacientes Únicos por Profesional (Registro y Auditoría)')
-        ax_unified.set_xlabel('Profesional')
-        ax_unified.set_ylabel('Número de Pacientes Únicos')
-
-        plt.xticks(rotation=45, ha='right')
-
-        for bar in bars_unified:
-            yval = bar.get_height()
-            ax_unified.text(bar.get_x() + bar.get_width() / 2, yval + 5, int(yval), ha='center', va='bottom',
-                            fontsize=10)
-
-        ax_unified.set_ylim(bottom=0, top=df_patients_per_professional_unified['pacientes_unicos_total'].max() * 1.15)
-        plt.tight_layout()
-        st.pyplot(fig_unified)
+    if not df_ranking_page.empty:
+        with profiler.stage('gráfico de productividad', rows=len(df_ranking_page)):
+            st.image(render_professional_ranking(
+                df_ranking_page, ranking_metric, ranking_others,
+                chart_key('ranking', df_ranking_page, ranking_metric, ranking_others)))
     else:
         st.info("No hay datos de productividad unificada para los filtros seleccionados.")
 
@@ -388,95 +701,70 @@ if is_single_professional_selected:
     st.subheader(f"Evolución Diaria Detallada para: {selected_professional_detail}")
     st.markdown("Desglose de actividad diaria como **Registrador** y **Auditor**.")
 
-    df_daily_activity_detail = df_filtered_unified[
-        df_filtered_unified['Profesional'] == selected_professional_detail].copy()
-    df_daily_activity_detail['FECHA_DIA'] = df_daily_activity_detail['FECHA DE REGISTRO DE NOVEDAD'].dt.date
+    # Resolución temporal: automática según la longitud del rango, o elegida por el usuario
+    resolution_selected = st.radio("Resolución temporal", options=['Automática'] + list(TIME_GRANULARITIES),
+                                   horizontal=True, key="evolution_resolution")
+    granularity = (choose_granularity(start_date, end_date) if resolution_selected == 'Automática'
+                   else resolution_selected)
+    granularity_label = {'Día': 'Diario', 'Semana': 'Semanal', 'Mes': 'Mensual'}[granularity]
 
-    if not df_daily_activity_detail.empty:
-        df_daily_counts_detail = df_daily_activity_detail.groupby(['FECHA_DIA', 'Tipo_Actividad']).size().unstack(
-            fill_value=0).reset_index()
-        df_daily_counts_detail = df_daily_counts_detail.sort_values(by='FECHA_DIA')
+    with profiler.stage('conteos diarios') as stage:
+        df_daily_counts_detail = rollup_activity_counts(
+            query_backend.daily_counts(selected_professional_detail, start_date, end_date), granularity)
+        stage['filas'] = len(df_daily_counts_detail)
 
-        st.markdown(f"**Acumulado Diario por Tipo de Actividad para {selected_professional_detail}:**")
+    if not df_daily_counts_detail.empty:
+        st.markdown(f"**Acumulado {granularity_label} por Tipo de Actividad para {selected_professional_detail}:**")
         st.dataframe(df_daily_counts_detail)
 
-        fig_daily_detail, ax_daily_detail = plt.subplots(figsize=(14, 7))
-
-        # --- APLICACIÓN DE ESTILO SIMILAR A LA IMAGEN (SOLO PARA ESTE GRÁFICO) ---
-        # Configurar el fondo y la cuadrícula (para imitar la imagen)
-        ax_daily_detail.set_facecolor('white')  # Fondo blanco del área del gráfico
-        fig_daily_detail.patch.set_facecolor('white')  # Fondo blanco de toda la figura
-
-        # Usar cuadrícula solo en el eje Y (horizontal), con líneas punteadas y gris claro
-        ax_daily_detail.grid(True, axis='y', linestyle='--', color='gray', alpha=0.7)
-        ax_daily_detail.grid(False, axis='x')  # Asegurar que no haya cuadrícula vertical
-        # Quitar los bordes del recuadro del gráfico para un aspecto más limpio
-        ax_daily_detail.spines['top'].set_visible(False)
-        ax_daily_detail.spines['right'].set_visible(False)
-        ax_daily_detail.spines['left'].set_color('gray')
-        ax_daily_detail.spines['bottom'].set_color('gray')
-        ax_daily_detail.tick_params(axis='x', colors='black')  # Color de los ticks del eje X
-        ax_daily_detail.tick_params(axis='y', colors='black')  # Color de los ticks del eje Y
-        ax_daily_detail.yaxis.label.set_color('black')  # Color de la etiqueta del eje Y
-        ax_daily_detail.xaxis.label.set_color('black')  # Color de la etiqueta del eje X
-        ax_daily_detail.title.set_color('black')  # Color del título
-        # --- FIN APLICACIÓN DE ESTILO ---
-
-        relevant_columns_for_max = []
-
-        # Usar colores que contrasten bien en fondo blanco
-        color_registro = '#1f77b4'  # Azul estándar de Matplotlib
-        color_auditoria = '#ff7f0e'  # Naranja estándar de Matplotlib
-
-        if 'Registro' in df_daily_counts_detail.columns:
-            # Trazar la línea de Registro
-            ax_daily_detail.plot(df_daily_counts_detail['FECHA_DIA'], df_daily_counts_detail['Registro'], marker='o',
-                                 linestyle='-', color=color_registro, label='Registros Diarios', linewidth=2)
-            # Añadir etiquetas de valor para cada punto de Registro
-            for i, txt in enumerate(df_daily_counts_detail['Registro']):
-                if txt > 0:  # Solo si hay actividad para ese día
-                    ax_daily_detail.annotate(int(txt), (
-                    df_daily_counts_detail['FECHA_DIA'].iloc[i], df_daily_counts_detail['Registro'].iloc[i]),
-                                             textcoords="offset points", xytext=(0, 10), ha='center', fontsize=9,
-                                             color='black')  # Texto en negro para contraste
-            relevant_columns_for_max.append('Registro')
-
-        if 'Auditoría' in df_daily_counts_detail.columns:
-            # Trazar la línea de Auditoría
-            ax_daily_detail.plot(df_daily_counts_detail['FECHA_DIA'], df_daily_counts_detail['Auditoría'], marker='x',
-                                 linestyle='--', color=color_auditoria, label='Auditorías Diarias', linewidth=2)
-            # Añadir etiquetas de valor para cada punto de Auditoría
-            for i, txt in enumerate(df_daily_counts_detail['Auditoría']):
-                if txt > 0:  # Solo si hay actividad para ese día
-                    ax_daily_detail.annotate(int(txt), (
-                    df_daily_counts_detail['FECHA_DIA'].iloc[i], df_daily_counts_detail['Auditoría'].iloc[i]),
-                                             textcoords="offset points", xytext=(0, -15), ha='center', fontsize=9,
-                                             color='black')  # Texto en negro para contraste
-            relevant_columns_for_max.append('Auditoría')
-
-        ax_daily_detail.set_title(f'Evolución Diaria de Actividades por {selected_professional_detail}', fontsize=18,
-                                  pad=20)  # Título más grande y con padding
-        ax_daily_detail.set_xlabel('Período (Día)', fontsize=14)
-        ax_daily_detail.set_ylabel('Total Actividades Diarias', fontsize=14)
-        ax_daily_detail.legend(frameon=False, loc='upper left',
-                               fontsize=12)  # Leyenda sin marco y arriba a la izquierda
-
-        # Establecer los ticks del eje X para que coincidan con las fechas de los datos
-        ax_daily_detail.set_xticks(df_daily_counts_detail['FECHA_DIA'])
-        fig_daily_detail.autofmt_xdate(rotation=45, ha='right')  # Asegura buena visibilidad de las fechas
-
-        # --- Manejo robusto del límite superior del eje Y ---
-        if relevant_columns_for_max:
-            max_y_value = df_daily_counts_detail[relevant_columns_for_max].max().max()
-        else:
-            max_y_value = 1  # Valor mínimo si no hay datos en las columnas relevantes
-
-        max_y_value = max(max_y_value, 1)  # Asegura que el límite sea al menos 1
-        ax_daily_detail.set_ylim(bottom=0, top=max_y_value * 1.25)  # Un poco más de espacio para etiquetas
-        # --- FIN FIX ---
-
-        plt.tight_layout()
-        st.pyplot(fig_daily_detail)
+        with profiler.stage('gráfico de evolución diaria', rows=len(df_daily_counts_detail)):
+            st.image(render_daily_activity(
+                df_daily_counts_detail, selected_professional_detail, granularity,
+                chart_key('evolucion_diaria', df_daily_counts_detail, selected_professional_detail, granularity)))
     else:
         st.info(
-            f"No hay datos de actividad diaria detallada para {selected_professional_detail} en el rango de fechas seleccionado.")
\ No newline at end of file
+            f"No hay datos de actividad diaria detallada para {selected_professional_detail} en el rango de fechas seleccionado.")
+
+# --- SECCIÓN: DESGLOSE POR CLASIFICACIÓN DE NOVEDAD (facetas, sin volver a las filas) ---
+st.markdown("---")
+st.subheader("Desglose por Clasificación de Novedad")
+breakdown_activity = st.radio("Tipo de actividad", options=['Todas'] + ACTIVITY_TYPES, horizontal=True,
+                              key="breakdown_activity")
+breakdown_activity_types = None if breakdown_activity == 'Todas' else [breakdown_activity]
+
+with profiler.stage('desglose por clasificación') as stage:
+    df_classification_totals = classification_activity_totals(
+        classification_facets, start_date, end_date, selected_professionals_filter, selected_classifications_filter)
+    stage['filas'] = len(df_classification_totals)
+
+if df_classification_totals.empty:
+    st.info("No hay actividades para las clasificaciones, profesionales y fechas seleccionados.")
+else:
+    st.markdown("**Actividades por Clasificación y Tipo de Actividad:**")
+    st.dataframe(df_classification_totals, hide_index=True)
+
+    if not is_single_professional_selected:
+        # Mismos profesionales y orden que la página actual del ranking
+        with profiler.stage('gráfico de clasificación por profesional', rows=len(df_ranking_page)):
+            df_breakdown_professionals = classification_breakdown(
+                classification_facets, start_date, end_date, 'Profesional', df_ranking_page['Profesional'].tolist(),
+                selected_classifications_filter, breakdown_activity_types)
+            df_breakdown_professionals = df_breakdown_professionals.set_index('Profesional').reindex(
+                df_ranking_page['Profesional'], fill_value=0).reset_index()
+            st.image(render_classification_breakdown(
+                df_breakdown_professionals, 'Actividades por Clasificación y Profesional', 'Profesional',
+                chart_key('clasificacion_profesional', df_breakdown_professionals)))
+
+    breakdown_granularity = granularity if is_single_professional_selected else choose_granularity(start_date,
+                                                                                                   end_date)
+    with profiler.stage('gráfico de clasificación por período') as stage:
+        df_breakdown_periods = rollup_activity_counts(classification_breakdown(
+            classification_facets, start_date, end_date, 'FECHA_DIA', selected_professionals_filter,
+            selected_classifications_filter, breakdown_activity_types), breakdown_granularity)
+        stage['filas'] = len(df_breakdown_periods)
+        if not df_breakdown_periods.empty:
+            st.image(render_classification_breakdown(
+                df_breakdown_periods, 'Evolución de Actividades por Clasificación', f'Período ({breakdown_granularity})',
+                chart_key('clasificacion_periodo', df_breakdown_periods, breakdown_granularity)))
+
+finish_profiling()
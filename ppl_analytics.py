@@ -0,0 +1,1215 @@
+"""
+Núcleo de análisis del Dashboard de Productividad del Profesional.
+
+Contiene las etapas del pipeline sin dependencia de Streamlit: ingesta de archivos subidos,
+normalización al esquema canónico, persistencia en Parquet, formato unificado de actividades,
+filtros y agregados. Lo usan la página de Streamlit (appdashboardppl.py) y los scripts por lotes.
+"""
+import glob
+import hashlib
+import io
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+# 1. Configuración de Persistencia de Datos
+PERSISTED_DATA_DIR = "../persisted_data"
+
+# Nombre de archivo para el DataFrame persistente (formato anterior, un único archivo)
+PRODUCTIVITY_FILE = os.path.join(PERSISTED_DATA_DIR, "df_productivity.parquet")
+# Conjunto Parquet particionado por año/mes al que se incorporan los archivos mensuales
+PRODUCTIVITY_DATASET_DIR = os.path.join(PERSISTED_DATA_DIR, "productividad")
+PARTITION_COLUMNS = ['ANIO', 'MES']
+# Columnas que identifican una novedad al deduplicar contra el histórico: su registro. El
+# auditor no forma parte de la clave porque una novedad suele auditarse después de registrada.
+DEDUP_KEY_COLUMNS = ['IDENTIFICACIÓN DEL PPL', 'FECHA DE REGISTRO DE NOVEDAD', 'RESPONSABLE DEL REGISTRO']
+AUDIT_COLUMN = 'RESPONSABLE AUDITORIA'
+DEFAULT_SHEET_NAME = "NOVEDADES JULIO"
+# Esquema canónico: se aplica una sola vez al ingresar los datos y se persiste tal cual.
+# Los textos se guardan como categóricos (códigos enteros + diccionario) y la fecha como timestamp.
+PRODUCTIVITY_SCHEMA = {
+    'RESPONSABLE DEL REGISTRO': 'category',
+    'RESPONSABLE AUDITORIA': 'category',
+    'IDENTIFICACIÓN DEL PPL': 'category',
+    'CLASIFICACION DE NOVEDAD': 'category',
+    'PRIMER NOMBRE': 'category',
+    'SEGUNDO NOMBRE': 'category',
+    'PRIMER APELLIDO': 'category',
+    'SEGUNDO APELLIDO': 'category',
+    'FECHA DE REGISTRO DE NOVEDAD': 'datetime'
+}
+# Caché en disco de archivos subidos ya normalizados, indexada por el SHA-256 del contenido, la hoja
+# y la versión de la normalización
+UPLOAD_CACHE_DIR = os.path.join(PERSISTED_DATA_DIR, "upload_cache")
+UPLOAD_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Incrementar al cambiar la lectura por bloques, prepare_productivity_frame o PRODUCTIVITY_SCHEMA:
+# forma parte de la clave de la caché de conversión e invalida los archivos ya normalizados
+NORMALIZATION_VERSION = 2
+# Filas por bloque al leer un archivo subido (CSV con chunksize, Excel en modo read-only)
+UPLOAD_CHUNK_ROWS = 20_000
+# Columnas que el dashboard necesita al leer el histórico persistido
+DASHBOARD_COLUMNS = ['RESPONSABLE DEL REGISTRO', 'RESPONSABLE AUDITORIA', 'IDENTIFICACIÓN DEL PPL',
+                     'FECHA DE REGISTRO DE NOVEDAD', 'CLASIFICACION DE NOVEDAD']
+# Índices invertidos paciente -> filas, uno por versión del conjunto de datos, con la misma política LRU
+PATIENT_INDEX_DIR = os.path.join(PERSISTED_DATA_DIR, "indice_pacientes")
+PATIENT_INDEX_MAX_BYTES = 128 * 1024 * 1024
+# Conteos precalculados por clasificación de novedad, uno por versión del conjunto de datos (misma política LRU)
+FACETS_DIR = os.path.join(PERSISTED_DATA_DIR, "facetas")
+FACETS_MAX_BYTES = 128 * 1024 * 1024
+
+
+def ensure_data_dir(path=PERSISTED_DATA_DIR):
+    """Crea el directorio de persistencia si no existe (no se hace al importar el módulo)."""
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# 2. Normalización y persistencia en Parquet
+def apply_schema(df):
+    """
+    Lleva las columnas de PRODUCTIVITY_SCHEMA a su tipo canónico. Las columnas que ya
+    tienen el tipo correcto no se tocan, por lo que sobre datos persistidos no hace nada.
+    """
+    for col, kind in PRODUCTIVITY_SCHEMA.items():
+        if col not in df.columns:
+            continue
+        if kind == 'category' and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].fillna('').astype(str).astype('category')
+        elif kind == 'datetime' and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df
+
+
+def _with_dictionary_index(arrow_type):
+    """Tipo Arrow con índices de diccionario int32 (los demás tipos no cambian)."""
+    if pa.types.is_dictionary(arrow_type):
+        return pa.dictionary(pa.int32(), arrow_type.value_type)
+    return arrow_type
+
+
+def to_arrow_table(df):
+    """
+    Tabla Arrow para escribir en Parquet. pandas elige el ancho de los códigos de cada
+    categórico según su número de categorías (int8, int16...), y dos archivos del mismo
+    conjunto con anchos distintos no se pueden leer juntos: se fijan todos en int32.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    schema = pa.schema([field.with_type(_with_dictionary_index(field.type)) for field in table.schema],
+                       metadata=table.schema.metadata)
+    return table.cast(schema)
+
+
+def _record_keys(df):
+    """Hash de 64 bits por fila sobre las columnas de DEDUP_KEY_COLUMNS."""
+    keys = pd.DataFrame({
+        col: (df[col].astype('datetime64[ns]').astype('int64') if col == 'FECHA DE REGISTRO DE NOVEDAD'
+              else df[col].astype(str))
+        for col in DEDUP_KEY_COLUMNS
+    })
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def _is_audited(df):
+    """Filas con responsable de auditoría (no nulo ni vacío)."""
+    if AUDIT_COLUMN not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    auditors = df[AUDIT_COLUMN]
+    return (auditors.notna() & (auditors != '')).to_numpy()
+
+
+def _rewrite_partition(dataset_dir, year, month, audited_keys):
+    """
+    Reescribe la partición ANIO/MES sin las filas sin auditor cuya novedad ya tiene una versión
+    auditada ('audited_keys') y retorna las filas que quedan. Los archivos nuevos se escriben en
+    un directorio oculto, que las lecturas ignoran, y reemplazan a la partición al renombrarlo.
+    """
+    partition_dir = _partition_dir(dataset_dir, year, month)
+    df_stored = load_dataframe(partition_dir)
+    superseded = ~_is_audited(df_stored) & np.isin(_record_keys(df_stored), audited_keys)
+    df_kept = df_stored[~superseded].reset_index(drop=True)
+
+    hidden_dir = os.path.join(dataset_dir, f".ANIO={year}_MES={month}.{os.getpid()}")
+    os.makedirs(f"{hidden_dir}.tmp")
+    pq.write_table(to_arrow_table(df_kept), os.path.join(f"{hidden_dir}.tmp", f"{uuid.uuid4().hex}-0.parquet"))
+    os.replace(partition_dir, f"{hidden_dir}.old")
+    os.replace(f"{hidden_dir}.tmp", partition_dir)
+    shutil.rmtree(f"{hidden_dir}.old")
+    return df_kept
+
+
+def append_to_dataset(df, dataset_dir):
+    """
+    Incorpora al conjunto particionado (ANIO/MES) sólo las novedades que aún no existen y
+    actualiza las facetas de clasificación de cada partición afectada (dataset_facets_dir).
+    Una novedad guardada sin auditor que vuelve a llegar auditada (el mes se exportó de nuevo
+    tras las auditorías) reemplaza a la fila guardada, reescribiendo su partición.
+    Únicamente se leen las claves de las particiones afectadas por el archivo nuevo, de modo
+    que el costo depende del tamaño del mes que se incorpora y no de todo el histórico.
+    Retorna el DataFrame con las filas efectivamente escritas (nuevas o ya auditadas).
+    """
+    df_new = df.copy()
+    for col in DEDUP_KEY_COLUMNS + [AUDIT_COLUMN]:
+        if col not in df_new.columns:
+            df_new[col] = ''
+    fechas = df_new['FECHA DE REGISTRO DE NOVEDAD']
+    df_new['ANIO'] = fechas.dt.year.astype('int32')
+    df_new['MES'] = fechas.dt.month.astype('int32')
+
+    months = [(int(year), int(month)) for year, month in
+              df_new[PARTITION_COLUMNS].drop_duplicates().itertuples(index=False)]
+    existing_months = [month for month in months if os.path.isdir(_partition_dir(dataset_dir, *month))]
+    rewrite_months = []
+    if existing_months:
+        stored = [load_dataframe(_partition_dir(dataset_dir, *month), columns=DEDUP_KEY_COLUMNS + [AUDIT_COLUMN])
+                  for month in existing_months]
+        stored_keys = [_record_keys(df_stored) for df_stored in stored]
+        stored_audited = [_is_audited(df_stored) for df_stored in stored]
+        all_keys, all_audited = np.concatenate(stored_keys), np.concatenate(stored_audited)
+        new_keys, new_audited = _record_keys(df_new), _is_audited(df_new)
+        known = np.isin(new_keys, all_keys)
+        audited_later = known & new_audited & ~np.isin(new_keys, all_keys[all_audited])
+        df_new = df_new[~known | audited_later]
+        # Meses con filas sin auditor ya superadas: por la versión auditada que llega ahora o
+        # por una guardada antes (históricos escritos cuando el auditor formaba parte de la clave)
+        audited_keys = np.concatenate([all_keys[all_audited], new_keys[audited_later]])
+        rewrite_months = [month for month, keys, audited in zip(existing_months, stored_keys, stored_audited)
+                          if (~audited & np.isin(keys, audited_keys)).any()]
+
+    if not df_new.empty or rewrite_months:
+        # Facetas de clasificación por partición: las del mes persistido (leídas antes de que la
+        # escritura cambie su versión) más las de las filas nuevas. Los meses sin facetas
+        # vigentes se resumen desde sus filas la próxima vez que se lean (load_dataset_facets).
+        previous_facets = {month: (_load_partition_facets(dataset_dir, *month) if month in existing_months
+                                   else empty_classification_facets()) for month in months}
+        for month in rewrite_months:
+            previous_facets[month] = build_classification_facets(_rewrite_partition(dataset_dir, *month,
+                                                                                    audited_keys))
+        if not df_new.empty:
+            pq.write_to_dataset(to_arrow_table(df_new), dataset_dir, partition_cols=PARTITION_COLUMNS)
+        new_by_month = {(int(year), int(month)): df_month
+                        for (year, month), df_month in df_new.groupby(PARTITION_COLUMNS)}
+        for month in months:
+            if previous_facets[month] is not None and (month in new_by_month or month in rewrite_months):
+                month_facets = [previous_facets[month]]
+                if month in new_by_month:
+                    month_facets.append(build_classification_facets(new_by_month[month]))
+                _store_partition_facets(merge_facets(month_facets), dataset_dir, *month)
+    return df_new.drop(columns=PARTITION_COLUMNS)
+
+
+def file_version(filepath):
+    """
+    Identificador de versión de un archivo persistido o de un conjunto particionado
+    (rutas, fechas de modificación y tamaños de sus archivos).
+    """
+    if not os.path.isdir(filepath):
+        file_stat = os.stat(filepath)
+        return f"{os.path.basename(filepath)}:{file_stat.st_mtime_ns}:{file_stat.st_size}"
+    digest = hashlib.sha256()
+    for root, _, files in sorted(os.walk(filepath)):
+        for name in sorted(files):
+            file_stat = os.stat(os.path.join(root, name))
+            digest.update(f"{os.path.relpath(os.path.join(root, name), filepath)}:"
+                          f"{file_stat.st_mtime_ns}:{file_stat.st_size};".encode())
+    return f"{os.path.basename(filepath)}:{digest.hexdigest()}"
+
+
+def _dataset_schema(dataset):
+    """
+    Esquema unificado de todos los archivos del dataset. Arrow toma por defecto el del primer
+    archivo (los directorios se ordenan como texto: MES=10 antes que MES=6), y una columna
+    opcional ausente en ese archivo desaparecería de todo el histórico. Los categóricos se
+    leen con índices int32 aunque algún archivo (p. ej. escrito antes de to_arrow_table) use
+    índices más angostos, para que Arrow no intente reducirlos.
+    """
+    types = {}
+    for fragment in dataset.get_fragments():
+        for field in fragment.physical_schema:
+            known = types.get(field.name)
+            # Una columna toda vacía en un archivo tiene tipo null; manda el tipo de los demás
+            if known is None or pa.types.is_null(known) or pa.types.is_dictionary(field.type):
+                types[field.name] = field.type
+    for field in dataset.schema:
+        types.setdefault(field.name, field.type)
+    return pa.schema([pa.field(name, _with_dictionary_index(arrow_type)) for name, arrow_type in types.items()])
+
+
+def _open_parquet_dataset(filepath):
+    """Abre un archivo Parquet o un conjunto particionado (ANIO=/MES=) como dataset de Arrow."""
+    dataset = ds.dataset(filepath, format='parquet', partitioning='hive')
+    return ds.dataset(filepath, schema=_dataset_schema(dataset), format='parquet', partitioning='hive')
+
+
+def _date_window_filter(dataset, date_range):
+    """
+    Expresión de filtro para el rango de fechas (inclusivo). En el conjunto particionado se
+    agregan las particiones ANIO/MES del rango para descartar directorios completos; en
+    cualquier caso Arrow usa las estadísticas de cada row group para no decodificar el resto.
+    """
+    start_date, end_date = date_range
+    date_field = ds.field('FECHA DE REGISTRO DE NOVEDAD')
+    window = (date_field >= pd.Timestamp(start_date)) & (date_field < pd.Timestamp(end_date) + pd.Timedelta(days=1))
+    if all(col in dataset.schema.names for col in PARTITION_COLUMNS):
+        months = pd.period_range(pd.Timestamp(start_date), pd.Timestamp(end_date), freq='M')
+        partitions = None
+        for month in months:
+            partition = (ds.field('ANIO') == month.year) & (ds.field('MES') == month.month)
+            partitions = partition if partitions is None else partitions | partition
+        window = partitions & window
+    return window
+
+
+def read_date_bounds(filepath):
+    """
+    Primera y última fecha de novedad del histórico persistido (datetime.date), leídas de
+    las estadísticas de los row groups sin decodificar la columna.
+    """
+    dataset = _open_parquet_dataset(filepath)
+    date_col = 'FECHA DE REGISTRO DE NOVEDAD'
+    mins, maxs = [], []
+    for fragment in dataset.get_fragments():
+        metadata = fragment.metadata
+        col_index = metadata.schema.to_arrow_schema().get_field_index(date_col)
+        for row_group in range(metadata.num_row_groups):
+            statistics = metadata.row_group(row_group).column(col_index).statistics
+            if statistics is None or not statistics.has_min_max:
+                # Sin estadísticas: se recurre a leer la columna de fechas
+                dates = dataset.to_table(columns=[date_col]).column(date_col).to_pandas()
+                return dates.min().date(), dates.max().date()
+            mins.append(pd.Timestamp(statistics.min))
+            maxs.append(pd.Timestamp(statistics.max))
+    if not mins:
+        return None
+    return min(mins).date(), max(maxs).date()
+
+
+def load_dataframe(filepath, columns=None, date_range=None):
+    """
+    Carga un DataFrame desde un archivo Parquet o desde el conjunto particionado.
+    Con 'columns' sólo se leen esas columnas y con 'date_range' (inicio, fin) sólo se
+    decodifican las filas de ese rango de fechas. Retorna None si la ruta no existe.
+    """
+    if not os.path.exists(filepath):
+        return None
+    dataset = _open_parquet_dataset(filepath)
+    if columns is None:
+        columns = [col for col in dataset.schema.names if col not in PARTITION_COLUMNS]
+    else:
+        columns = [col for col in columns if col in dataset.schema.names]
+    row_filter = _date_window_filter(dataset, date_range) if date_range is not None else None
+    df_loaded = dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+    # Sólo convierte archivos guardados antes del esquema canónico
+    return apply_schema(df_loaded)
+
+
+# 3. Ingesta de archivos subidos
+def detect_file_format(filename, file_bytes):
+    """Determina si el archivo es 'xlsx' o 'csv' por su extensión o, en su defecto, por sus bytes mágicos."""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in ('.xlsx', '.csv'):
+        return extension[1:]
+    # Un .xlsx es un contenedor ZIP
+    return 'xlsx' if file_bytes[:4] == b'PK\x03\x04' else 'csv'
+
+
+def _read_csv_chunks(file_bytes, chunk_rows):
+    """Bloques de texto del CSV con la fracción de bytes leída; los tipos se infieren al final."""
+    buffer = io.BytesIO(file_bytes)
+    with pd.read_csv(buffer, encoding='utf-8', encoding_errors='ignore', on_bad_lines='skip', dtype=str,
+                     chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield chunk, buffer.tell() / max(len(file_bytes), 1)
+
+
+def _excel_cell(value):
+    # Igual que pd.read_excel: los flotantes enteros de Excel se leen como int
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+def _read_excel_chunks(file_bytes, sheet_name, chunk_rows):
+    """Bloques de la hoja leída fila a fila con openpyxl en modo read-only, con la fracción de filas leída."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+    try:
+        if sheet_name not in workbook.sheetnames:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        sheet = workbook[sheet_name]
+        total_rows = max((sheet.max_row or 0) - 1, 1)
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        columns = [f"Unnamed: {position}" if name is None else name for position, name in enumerate(header)]
+        batch = []
+        blank_rows = 0
+        read_rows = 0
+        for row in rows:
+            read_rows += 1
+            # Como en pd.read_excel, las filas vacías intermedias quedan en blanco y las finales se omiten
+            if not any(value is not None for value in row):
+                blank_rows += 1
+                continue
+            batch.extend([[None] * len(columns)] * blank_rows)
+            blank_rows = 0
+            batch.append([_excel_cell(value) for value in row[:len(columns)]])
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=columns), min(read_rows / total_rows, 1.0)
+                batch = []
+        yield pd.DataFrame(batch, columns=columns), 1.0
+    finally:
+        workbook.close()
+
+
+def read_upload_chunks(file_bytes, filename, sheet_name=DEFAULT_SHEET_NAME, chunk_rows=UPLOAD_CHUNK_ROWS):
+    """
+    Lee un archivo CSV o Excel por bloques de 'chunk_rows' filas. Produce tuplas (bloque,
+    fracción leída entre 0 y 1) para que quien lo consuma pueda informar el progreso.
+    """
+    if detect_file_format(filename, file_bytes) == 'csv':
+        return _read_csv_chunks(file_bytes, chunk_rows)
+    return _read_excel_chunks(file_bytes, sheet_name, chunk_rows)
+
+
+def load_uploaded_data(file_bytes, filename, sheet_name=DEFAULT_SHEET_NAME, progress=None):
+    """
+    Carga el contenido de un archivo CSV o Excel en un DataFrame de Pandas, leído por bloques.
+    'progress' (opcional) recibe la fracción leída después de cada bloque.
+    Las excepciones de lectura (p. ej. una hoja inexistente) se propagan al llamador.
+    """
+    chunks = []
+    for chunk, fraction in read_upload_chunks(file_bytes, filename, sheet_name):
+        chunks.append(chunk)
+        if progress is not None:
+            progress(fraction)
+    if all(chunk.empty for chunk in chunks):
+        # Sin filas de datos (sólo el encabezado): no hay tipos que inferir
+        if detect_file_format(filename, file_bytes) == 'csv':
+            return pd.read_csv(io.BytesIO(file_bytes), encoding='utf-8', encoding_errors='ignore', nrows=0)
+        return chunks[0]
+    df_loaded = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    # Los bloques no infieren tipos por su cuenta (el CSV se lee como texto): las columnas
+    # completamente numéricas o vacías se convierten al final, como lo haría una sola lectura
+    for col in df_loaded.columns:
+        if not (pd.api.types.is_object_dtype(df_loaded[col]) or isinstance(df_loaded[col].dtype, pd.StringDtype)):
+            continue
+        try:
+            df_loaded[col] = pd.to_numeric(df_loaded[col])
+        except (ValueError, TypeError):
+            pass
+    return df_loaded
+
+
+def prepare_productivity_frame(df_loaded):
+    """
+    Normaliza un archivo recién cargado (nombres de columna y esquema canónico) y retorna
+    la tupla (DataFrame, columnas requeridas faltantes).
+    """
+    df_loaded.columns = df_loaded.columns.str.upper()
+
+    required_cols_for_check = {
+        'RESPONSABLE DEL REGISTRO': str,
+        'FECHA DE REGISTRO DE NOVEDAD': 'datetime',
+        'IDENTIFICACIÓN DEL PPL': str
+    }
+    if 'RESPONSABLE AUDITORIA' in df_loaded.columns:
+        required_cols_for_check['RESPONSABLE AUDITORIA'] = str
+
+    if 'CLASIFICACION DE NOVEDAD' in df_loaded.columns:
+        required_cols_for_check['CLASIFICACION DE NOVEDAD'] = str
+
+    missing_cols = [col for col in required_cols_for_check if col not in df_loaded.columns]
+    if not missing_cols:
+        apply_schema(df_loaded)
+        df_loaded.dropna(subset=['FECHA DE REGISTRO DE NOVEDAD'], inplace=True)
+    return df_loaded, missing_cols
+
+
+def upload_cache_key(file_bytes, sheet_name):
+    """
+    Clave de la caché de conversión: SHA-256 del contenido subido más el nombre de la hoja y
+    la versión de la normalización (NORMALIZATION_VERSION).
+    """
+    digest = hashlib.sha256(file_bytes)
+    digest.update(f"\0{sheet_name}\0{NORMALIZATION_VERSION}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def upload_cache_path(cache_key):
+    """Ruta del archivo Parquet de la caché de conversión para una clave."""
+    return os.path.join(UPLOAD_CACHE_DIR, f"{cache_key}.parquet")
+
+
+def store_upload_cache(df, cache_key):
+    """
+    Escribe un DataFrame normalizado en la caché de conversión, junto con sus facetas de
+    clasificación (upload_facets_path); retorna False si no se pudo guardar el DataFrame.
+    """
+    if not write_file_atomic(upload_cache_path(cache_key), lambda tmp_path: df.to_parquet(tmp_path, index=False),
+                             UPLOAD_CACHE_MAX_BYTES):
+        return False
+    save_facets(build_classification_facets(df), upload_facets_path(cache_key))
+    return True
+
+
+def write_file_atomic(path, write, max_bytes=None):
+    """
+    Escribe 'path' llamando a write(ruta_temporal) y lo reemplaza en un solo paso, de modo
+    que otros procesos nunca leen un archivo a medio escribir. Con 'max_bytes' el directorio
+    es una caché: luego se descartan las entradas usadas hace más tiempo (_evict_lru_files).
+    Retorna False si no se pudo escribir.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write(tmp_path)
+        os.replace(tmp_path, path)
+        if max_bytes is not None:
+            _evict_lru_files(os.path.dirname(path), max_bytes, os.path.splitext(path)[1])
+        return True
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def _evict_lru_files(cache_dir, max_bytes, suffix):
+    """Elimina las entradas usadas hace más tiempo hasta que la caché quepa en 'max_bytes' (LRU por mtime)."""
+    entries = [entry for entry in os.scandir(cache_dir) if entry.name.endswith(suffix)]
+    entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+    total_bytes = sum(entry.stat().st_size for entry in entries)
+    for entry in entries:
+        if total_bytes <= max_bytes:
+            break
+        total_bytes -= entry.stat().st_size
+        os.remove(entry.path)
+
+
+def prepared_upload_key(file_bytes, filename, sheet_name=DEFAULT_SHEET_NAME):
+    """Clave de caché de un archivo subido (la hoja sólo cuenta en los archivos Excel)."""
+    is_excel = detect_file_format(filename, file_bytes) == 'xlsx'
+    return upload_cache_key(file_bytes, sheet_name if is_excel else '')
+
+
+def load_prepared_upload(file_bytes, filename, sheet_name=DEFAULT_SHEET_NAME, progress=None):
+    """
+    Retorna (DataFrame normalizado, columnas faltantes, clave de caché) para un archivo subido.
+    Si el mismo contenido ya se convirtió antes, se lee directamente de la caché en disco;
+    si no, se parsea, se normaliza y se guarda en la caché. 'progress' se pasa a load_uploaded_data.
+    """
+    cache_key = prepared_upload_key(file_bytes, filename, sheet_name)
+    cache_path = upload_cache_path(cache_key)
+
+    if os.path.exists(cache_path):
+        try:
+            df_cached = pd.read_parquet(cache_path)
+            os.utime(cache_path)
+            return df_cached, [], cache_key
+        except Exception:
+            os.remove(cache_path)
+
+    df_loaded, missing_cols = prepare_productivity_frame(load_uploaded_data(file_bytes, filename, sheet_name,
+                                                                            progress))
+    if not missing_cols:
+        store_upload_cache(df_loaded, cache_key)
+    return df_loaded, missing_cols, cache_key
+
+
+# 4. Formato unificado de actividades (Registro y Auditoría)
+UNIFIED_COLUMNS = ['Profesional', 'Tipo_Actividad', 'IDENTIFICACIÓN DEL PPL', 'FECHA DE REGISTRO DE NOVEDAD']
+ACTIVITY_SOURCE_COLUMNS = [('RESPONSABLE DEL REGISTRO', 'Registro'), ('RESPONSABLE AUDITORIA', 'Auditoría')]
+ACTIVITY_TYPES = [activity for _, activity in ACTIVITY_SOURCE_COLUMNS]
+
+
+def build_unified_activity(df):
+    """
+    Convierte cada novedad en una fila por actividad (Registro y/o Auditoría) con las
+    columnas 'Profesional' y 'Tipo_Actividad', conservando el orden original de las filas.
+    """
+    positions = []
+    selections = []
+    responsables_parts = []
+    activity_codes = []
+    for order, (source_col, activity) in enumerate(ACTIVITY_SOURCE_COLUMNS):
+        if source_col not in df.columns:
+            continue
+        responsables = df[source_col]
+        mask = (responsables.notna() & (responsables != '')).to_numpy()
+        if not mask.any():
+            continue
+        selected = np.flatnonzero(mask)
+        positions.append(selected * 2 + order)
+        selections.append(selected)
+        responsables_parts.append(pd.Categorical(responsables.iloc[selected]))
+        activity_codes.append(np.full(selected.size, order, dtype='int8'))
+
+    if not selections:
+        return pd.DataFrame(columns=UNIFIED_COLUMNS)
+
+    # Intercalar Registro y Auditoría de cada novedad, igual que el recorrido fila por fila
+    order_index = np.argsort(np.concatenate(positions), kind='stable')
+    source_rows = np.concatenate(selections)[order_index]
+    return pd.DataFrame({
+        'Profesional': union_categoricals(responsables_parts).take(order_index),
+        'Tipo_Actividad': pd.Categorical.from_codes(np.concatenate(activity_codes)[order_index],
+                                                    categories=ACTIVITY_TYPES),
+        'IDENTIFICACIÓN DEL PPL': df['IDENTIFICACIÓN DEL PPL'].array.take(source_rows),
+        'FECHA DE REGISTRO DE NOVEDAD': df['FECHA DE REGISTRO DE NOVEDAD'].to_numpy()[source_rows]
+    })
+
+
+# 5. Filtros y cubo de agregados Profesional × Día × Tipo de Actividad
+def filter_by_date(df, start_date, end_date):
+    """Filas del DataFrame cuya fecha de novedad cae en el rango de fechas inclusivo."""
+    fechas = df['FECHA DE REGISTRO DE NOVEDAD']
+    mask = (fechas >= pd.Timestamp(start_date)) & (fechas < pd.Timestamp(end_date) + pd.Timedelta(days=1))
+    return df[mask]
+
+
+def build_activity_cube(df_unified, approximate=False):
+    """
+    Precalcula, a partir del formato unificado, los conteos diarios por profesional y tipo
+    de actividad y los conjuntos diarios de pacientes por profesional (códigos enteros sin
+    repetir), de modo que cualquier rango de fechas se responda sin volver a las filas.
+    Con approximate=True los conjuntos de pacientes se reemplazan por sketches HyperLogLog
+    por profesional y día (ver build_patient_sketches).
+    """
+    patient_codes, patient_ids = pd.factorize(df_unified['IDENTIFICACIÓN DEL PPL'])
+    keyed = pd.DataFrame({
+        'Profesional': df_unified['Profesional'].to_numpy(),
+        'FECHA_DIA': pd.to_datetime(df_unified['FECHA DE REGISTRO DE NOVEDAD']).dt.normalize().to_numpy(),
+        'Tipo_Actividad': df_unified['Tipo_Actividad'].to_numpy(),
+        'PACIENTE': patient_codes
+    }).dropna(subset=['FECHA_DIA'])
+
+    counts = keyed.groupby(['FECHA_DIA', 'Profesional', 'Tipo_Actividad'], observed=True).size().unstack(fill_value=0)
+    counts = counts.reindex(columns=pd.Index(ACTIVITY_TYPES), fill_value=0).reset_index()
+    counts.columns.name = None
+
+    patients = keyed[['FECHA_DIA', 'Profesional', 'PACIENTE']].drop_duplicates()
+    patients = patients.sort_values(['FECHA_DIA', 'Profesional'], kind='stable').reset_index(drop=True)
+
+    if approximate:
+        return {'counts': counts, 'sketches': build_patient_sketches(patients, patient_ids)}
+    return {'counts': counts, 'patients': patients, 'patient_ids': patient_ids}
+
+
+def _day_bounds(frame, start_date, end_date):
+    """Posiciones [lo, hi) de las filas de una tabla ordenada por FECHA_DIA dentro del rango inclusivo."""
+    days = frame['FECHA_DIA'].to_numpy()
+    lo = np.searchsorted(days, np.datetime64(pd.Timestamp(start_date)), side='left')
+    hi = np.searchsorted(days, np.datetime64(pd.Timestamp(end_date)), side='right')
+    return lo, hi
+
+
+def _slice_days(frame, start_date, end_date):
+    """Recorta una tabla del cubo (ordenada por FECHA_DIA) al rango de fechas inclusivo."""
+    lo, hi = _day_bounds(frame, start_date, end_date)
+    return frame.iloc[lo:hi]
+
+
+def cube_date_bounds(cube):
+    """Retorna la primera y la última fecha (datetime.date) con actividad en el cubo."""
+    days = cube['counts']['FECHA_DIA']
+    return days.iloc[0].date(), days.iloc[-1].date()
+
+
+def cube_professionals(cube, start_date, end_date):
+    """Lista ordenada de profesionales con actividad dentro del rango de fechas."""
+    return sorted(_slice_days(cube['counts'], start_date, end_date)['Profesional'].unique())
+
+
+def summarize_professionals(cube, start_date, end_date, professionals=None):
+    """
+    Pacientes únicos y actividades totales por profesional en el rango de fechas,
+    opcionalmente restringido a una lista de profesionales.
+    """
+    counts = _slice_days(cube['counts'], start_date, end_date)
+    if professionals is not None:
+        counts = counts[counts['Profesional'].isin(professionals)]
+    actividades = counts.groupby('Profesional', observed=True)[ACTIVITY_TYPES].sum().sum(axis=1)
+    actividades.index = actividades.index.astype(str)
+
+    if 'sketches' in cube:
+        names, registers = _merge_sketches(cube['sketches'], start_date, end_date, professionals)
+        pacientes = pd.Series(np.rint(hll_estimate(registers)).astype(int), index=names.astype(str))
+        # Nadie puede tener más pacientes distintos que actividades
+        pacientes = np.minimum(pacientes.reindex(actividades.index, fill_value=0), actividades)
+    else:
+        patients = _slice_days(cube['patients'], start_date, end_date)
+        if professionals is not None:
+            patients = patients[patients['Profesional'].isin(professionals)]
+        pacientes = patients.drop_duplicates(['Profesional', 'PACIENTE']).groupby('Profesional', observed=True).size()
+        pacientes.index = pacientes.index.astype(str)
+
+    summary = pd.DataFrame({
+        'pacientes_unicos_total': pacientes.reindex(actividades.index, fill_value=0).astype(int),
+        'actividades_totales': actividades.astype(int)
+    })
+    summary.index.name = 'Profesional'
+    return summary.reset_index()
+
+
+# Métricas con que se puede ordenar el ranking de profesionales -> nombre para mostrar
+RANKING_METRICS = {'pacientes_unicos_total': 'Pacientes únicos', 'actividades_totales': 'Actividades totales'}
+
+
+def rank_professionals(summary, metric='pacientes_unicos_total', page_size=20, page=0, ascending=False):
+    """
+    Página 'page' (desde 0) del ranking de summarize_professionals por 'metric', de mayor a
+    menor (o de menor a mayor con ascending=True), con la columna 'Posición'. Sólo se ordenan
+    las filas hasta el final de la página: el resto se descarta con una selección parcial.
+    Los empates se ordenan por nombre de profesional.
+    """
+    start = page * page_size
+    stop = min(start + page_size, len(summary))
+    if start >= stop:
+        empty = summary.iloc[0:0].reset_index(drop=True)
+        empty.insert(0, 'Posición', np.arange(0, dtype='int64'))
+        return empty
+
+    values = summary[metric].to_numpy()
+    keys = values if ascending else -values
+    if stop < len(summary):
+        # Todas las filas que pueden caer antes del final de la página, incluidos los empates del borde
+        threshold = keys[np.argpartition(keys, stop - 1)[stop - 1]]
+        candidates = np.flatnonzero(keys <= threshold)
+    else:
+        candidates = np.arange(len(summary))
+    names = summary['Profesional'].to_numpy()[candidates]
+    ordered = candidates[np.lexsort((names, keys[candidates]))]
+    ranking = summary.iloc[ordered[start:stop]].reset_index(drop=True)
+    ranking.insert(0, 'Posición', np.arange(start + 1, stop + 1))
+    return ranking
+
+
+def others_aggregate(cube, start_date, end_date, professionals):
+    """
+    Totales del grupo de profesionales indicado (los que quedan fuera de una página del
+    ranking): cantidad de profesionales, pacientes únicos del grupo en el rango (cada
+    paciente cuenta una vez aunque lo atiendan varios) y actividades totales. None si el
+    grupo está vacío.
+    """
+    if len(professionals) == 0:
+        return None
+    counts = _slice_days(cube['counts'], start_date, end_date)
+    counts = counts[counts['Profesional'].isin(professionals)]
+    actividades = int(counts[ACTIVITY_TYPES].to_numpy().sum())
+    if 'sketches' in cube:
+        _, registers = _merge_sketches(cube['sketches'], start_date, end_date, professionals)
+        merged = registers.max(axis=0, initial=0, keepdims=True)
+        pacientes = min(int(np.rint(hll_estimate(merged)[0])), actividades)
+    else:
+        patients = _slice_days(cube['patients'], start_date, end_date)
+        pacientes = int(patients.loc[patients['Profesional'].isin(professionals), 'PACIENTE'].nunique())
+    return {
+        'profesionales': len(professionals),
+        'pacientes_unicos_total': pacientes,
+        'actividades_totales': actividades,
+    }
+
+
+def _format_daily_counts(daily):
+    """Deja sólo FECHA_DIA (como fecha) y los tipos de actividad presentes, en orden alfabético."""
+    present_types = [activity for activity in sorted(ACTIVITY_TYPES) if daily[activity].sum() > 0]
+    daily = daily[['FECHA_DIA'] + present_types].reset_index(drop=True)
+    daily['FECHA_DIA'] = daily['FECHA_DIA'].dt.date
+    daily.columns.name = 'Tipo_Actividad'
+    return daily
+
+
+def daily_activity_counts(cube, professional, start_date, end_date):
+    """
+    Conteo diario por tipo de actividad de un profesional, con una columna por cada
+    tipo de actividad presente en el rango (mismo formato que el antiguo unstack).
+    """
+    counts = _slice_days(cube['counts'], start_date, end_date)
+    return _format_daily_counts(counts[counts['Profesional'] == professional].drop(columns='Profesional'))
+
+
+def daily_activity_counts_by_professional(cube, start_date, end_date):
+    """
+    Conteos diarios de todos los profesionales en una sola pasada agrupada: retorna un dict
+    {profesional: tabla} con el mismo formato que daily_activity_counts.
+    """
+    counts = _slice_days(cube['counts'], start_date, end_date)
+    return {str(professional): _format_daily_counts(daily.drop(columns='Profesional'))
+            for professional, daily in counts.groupby('Profesional', observed=True, sort=True)}
+
+
+# 6. Resolución temporal de la evolución de actividades
+# Granularidad -> (columna del período, regla de resample). Las semanas son ISO: empiezan el lunes.
+TIME_GRANULARITIES = {
+    'Día': ('FECHA_DIA', 'D'),
+    'Semana': ('SEMANA', 'W-MON'),
+    'Mes': ('MES', 'MS'),
+}
+# Máximo de puntos con que la granularidad automática dibuja la evolución de un profesional
+MAX_EVOLUTION_POINTS = 62
+
+
+def choose_granularity(start_date, end_date, max_points=MAX_EVOLUTION_POINTS):
+    """Granularidad más fina ('Día', 'Semana' o 'Mes') que no supera max_points en el rango."""
+    days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1
+    if days <= max_points:
+        return 'Día'
+    if -(-days // 7) + 1 <= max_points:
+        return 'Semana'
+    return 'Mes'
+
+
+def rollup_activity_counts(daily, granularity):
+    """
+    Agrega una tabla de daily_activity_counts a la granularidad indicada. La primera columna
+    pasa a ser el período (fecha de inicio de la semana ISO o del mes) y se conservan los
+    tipos de actividad; los períodos sin actividad dentro del rango quedan en cero.
+    """
+    period_column, rule = TIME_GRANULARITIES[granularity]
+    if granularity == 'Día' or daily.empty:
+        return daily.rename(columns={'FECHA_DIA': period_column})
+
+    indexed = daily.set_index(pd.to_datetime(daily['FECHA_DIA'])).drop(columns='FECHA_DIA')
+    rolled = indexed.resample(rule, label='left', closed='left').sum()
+    rolled.index = rolled.index.date
+    rolled.index.name = period_column
+    rolled.columns.name = 'Tipo_Actividad'
+    return rolled.reset_index()
+
+
+# 7. Índice invertido de pacientes (IDENTIFICACIÓN DEL PPL -> posiciones de fila)
+def build_patient_index(df):
+    """
+    Índice invertido de un DataFrame de novedades: 'ids' (pd.Index de identificaciones),
+    'positions' (posiciones de fila agrupadas por paciente, en orden original) y 'offsets'
+    (las filas del paciente i son positions[offsets[i]:offsets[i + 1]]).
+    """
+    codes, uniques = pd.factorize(df['IDENTIFICACIÓN DEL PPL'])
+    valid = codes >= 0
+    positions = np.flatnonzero(valid)
+    positions = positions[np.argsort(codes[valid], kind='stable')]
+    offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes[valid], minlength=len(uniques)), out=offsets[1:])
+    return {'ids': pd.Index(np.asarray(uniques, dtype=str)), 'positions': positions.astype(np.int64),
+            'offsets': offsets}
+
+
+def _parquet_files(source):
+    """Archivos Parquet de un conjunto particionado (en orden estable) o el archivo único."""
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, '**', '*.parquet'), recursive=True))
+    return [source]
+
+
+def build_dataset_patient_index(source):
+    """
+    Índice invertido de todo un histórico Parquet ('source': conjunto particionado o archivo
+    único), leyendo sólo la columna de identificación archivo por archivo. Las posiciones
+    recorren los archivos de 'files' en orden; 'file_rows' guarda las filas de cada uno para
+    que read_indexed_rows lea luego sólo los row groups de un paciente.
+    """
+    files = _parquet_files(source)
+    ids = [pq.read_table(path, columns=['IDENTIFICACIÓN DEL PPL']).column(0).to_pandas().astype('category')
+           for path in files]
+    patient_ids = union_categoricals(ids, ignore_order=True) if ids else pd.Categorical([])
+    index = build_patient_index(pd.DataFrame({'IDENTIFICACIÓN DEL PPL': patient_ids}))
+    index['files'] = np.asarray(files, dtype=str)
+    index['file_rows'] = np.asarray([len(part) for part in ids], dtype=np.int64)
+    return index
+
+
+def read_indexed_rows(index, rows, columns):
+    """
+    Filas de un índice de build_dataset_patient_index (posiciones ordenadas) leídas del
+    Parquet: de cada archivo sólo se decodifican los row groups que las contienen.
+    """
+    file_starts = np.concatenate([[0], np.cumsum(index['file_rows'])])
+    file_numbers = np.searchsorted(file_starts, rows, side='right') - 1
+    parts = []
+    for file_number in np.unique(file_numbers):
+        local_rows = rows[file_numbers == file_number] - file_starts[file_number]
+        parquet_file = pq.ParquetFile(index['files'][file_number])
+        group_starts = np.concatenate([[0], np.cumsum([parquet_file.metadata.row_group(group).num_rows
+                                                       for group in range(parquet_file.num_row_groups)])])
+        row_groups = np.searchsorted(group_starts, local_rows, side='right') - 1
+        selected_groups = np.unique(row_groups)
+        # Posición de cada fila dentro de la concatenación de los row groups leídos
+        selected_starts = np.concatenate([[0], np.cumsum(np.diff(group_starts)[selected_groups])])
+        positions = local_rows - group_starts[row_groups] + selected_starts[np.searchsorted(selected_groups,
+                                                                                             row_groups)]
+        present = [col for col in columns if col in parquet_file.schema_arrow.names]
+        table = parquet_file.read_row_groups(selected_groups.tolist(), columns=present)
+        parts.append(table.take(positions).to_pandas())
+    if not parts:
+        # Sin filas, con los mismos tipos que una lectura no vacía (fechas, categóricos)
+        return apply_schema(pd.DataFrame(columns=columns))
+    return pd.concat(parts, ignore_index=True).reindex(columns=columns)
+
+
+def patient_index_path(dataset_key):
+    """Ruta del índice persistido para una versión de conjunto de datos (cualquier clave con repr estable)."""
+    return os.path.join(PATIENT_INDEX_DIR, f"{hashlib.sha256(repr(dataset_key).encode()).hexdigest()}.npz")
+
+
+def save_patient_index(index, index_path):
+    """Escribe el índice en formato .npz; retorna False si no se pudo (la búsqueda sigue en memoria)."""
+    def write(tmp_path):
+        # Con un archivo abierto np.savez no agrega la extensión .npz a la ruta temporal
+        with open(tmp_path, 'wb') as tmp_file:
+            np.savez(tmp_file, **{**index, 'ids': index['ids'].to_numpy(dtype=str)})
+
+    return write_file_atomic(index_path, write, PATIENT_INDEX_MAX_BYTES)
+
+
+def load_patient_index(index_path):
+    """Lee un índice guardado con save_patient_index, o retorna None si no existe o está dañado."""
+    try:
+        with np.load(index_path, allow_pickle=False) as stored:
+            index = {key: stored[key] for key in stored.files}
+        index['ids'] = pd.Index(index['ids'])
+        os.utime(index_path)
+        return index
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def patient_rows(index, patient_id):
+    """Posiciones de fila del paciente (arreglo vacío si no aparece), sin recorrer el DataFrame."""
+    try:
+        code = index['ids'].get_loc(str(patient_id).strip())
+    except KeyError:
+        return index['positions'][:0]
+    return index['positions'][index['offsets'][code]:index['offsets'][code + 1]]
+
+
+def patient_timeline(df, index, patient_id):
+    """
+    Historial de Registro y Auditoría de un paciente en orden cronológico: una fila por
+    actividad con la fecha, el tipo de actividad y el profesional responsable. Con un índice
+    de build_dataset_patient_index 'df' no se usa (puede ser None): las filas del paciente se
+    leen del Parquet.
+    """
+    rows = patient_rows(index, patient_id)
+    if 'files' in index:
+        df = read_indexed_rows(index, rows, ['FECHA DE REGISTRO DE NOVEDAD'] +
+                               [source_col for source_col, _ in ACTIVITY_SOURCE_COLUMNS])
+        rows = np.arange(len(df))
+    fechas = df['FECHA DE REGISTRO DE NOVEDAD'].to_numpy()[rows]
+    parts = []
+    for source_col, activity in ACTIVITY_SOURCE_COLUMNS:
+        if source_col not in df.columns:
+            continue
+        # Sólo se leen las filas del paciente, sin expandir los diccionarios de los categóricos
+        responsables = np.asarray(df[source_col].array.take(rows), dtype=object)
+        mask = pd.notna(responsables) & (responsables != '')
+        parts.append(pd.DataFrame({'FECHA DE REGISTRO DE NOVEDAD': fechas[mask], 'Tipo_Actividad': activity,
+                                   'Profesional': responsables[mask]}))
+    if not parts:
+        return pd.DataFrame(columns=['FECHA DE REGISTRO DE NOVEDAD', 'Tipo_Actividad', 'Profesional'])
+    timeline = pd.concat(parts, ignore_index=True)
+    return timeline.sort_values('FECHA DE REGISTRO DE NOVEDAD', kind='stable').reset_index(drop=True)
+
+
+# 8. Conteo aproximado de pacientes únicos (HyperLogLog)
+# Precisión p: cada sketch tiene 2**p registros (sólo se guardan los no nulos, 3 bytes cada uno).
+# El error estándar relativo de la estimación es 1.04 / sqrt(2**p), un 3,25 % con p=10 (≈95 % de
+# las estimaciones dentro del ±6,5 %), sin importar cuántos sketches se combinen ni el tamaño del
+# rango de fechas. Los conteos pequeños (hasta ~2,5·2**p) usan conteo lineal y son casi exactos.
+HLL_PRECISION = 10
+HLL_STANDARD_ERROR = 1.04 / np.sqrt(2 ** HLL_PRECISION)
+
+
+def _bit_length(values):
+    """Número de bits significativos de cada entero sin signo de 64 bits (exacto, sin flotantes)."""
+    values = values.copy()
+    lengths = np.zeros(values.shape, dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        wide = values >= (np.uint64(1) << np.uint64(shift))
+        values[wide] >>= np.uint64(shift)
+        lengths[wide] += shift
+    return lengths + (values > 0)
+
+
+def build_patient_sketches(patients, patient_ids, precision=HLL_PRECISION):
+    """
+    Sketches HyperLogLog por profesional y día a partir de la tabla 'patients' del cubo
+    (ordenada por FECHA_DIA y Profesional, con códigos de 'patient_ids'). Se guardan en forma
+    dispersa, sólo los registros distintos de cero: 'cells' (FECHA_DIA y Profesional de cada
+    sketch), 'offsets' (rango de registros de cada sketch), 'buckets' y 'ranks'. Un sketch nunca
+    ocupa más de 2**precision registros, por muchos pacientes que atienda el profesional ese día.
+    """
+    # Un hash de 64 bits por paciente distinto; el código -1 (sin identificación) usa el último
+    hashes = pd.util.hash_pandas_object(pd.Series(np.asarray(patient_ids, dtype=str)), index=False).to_numpy()
+    hashes = np.append(hashes, pd.util.hash_pandas_object(pd.Series([np.nan]), index=False).to_numpy())
+    patient_hashes = hashes[patients['PACIENTE'].to_numpy()]
+
+    suffix_bits = np.uint64(64 - precision)
+    buckets = (patient_hashes >> suffix_bits).astype(np.int64)
+    suffixes = patient_hashes & ((np.uint64(1) << suffix_bits) - np.uint64(1))
+    ranks = (int(suffix_bits) - _bit_length(suffixes) + 1).astype(np.uint8)
+
+    cell_ids = patients.groupby(['FECHA_DIA', 'Profesional'], observed=True, sort=False).ngroup().to_numpy()
+    cells = patients[['FECHA_DIA', 'Profesional']].drop_duplicates().reset_index(drop=True)
+    # Un registro por (sketch, bucket) con el rango máximo, ordenados por sketch
+    registers = pd.Series(ranks).groupby(cell_ids * 2 ** precision + buckets).max()
+    register_cells = registers.index.to_numpy() // 2 ** precision
+    return {
+        'cells': cells,
+        'offsets': np.searchsorted(register_cells, np.arange(len(cells) + 1)),
+        'buckets': (registers.index.to_numpy() % 2 ** precision).astype(np.uint16),
+        'ranks': registers.to_numpy(),
+        'precision': precision,
+    }
+
+
+def _merge_sketches(sketches, start_date, end_date, professionals=None):
+    """
+    Combina (máximo por bucket) los sketches del rango de fechas por profesional. Retorna
+    (nombres de los profesionales, matriz densa con un sketch combinado por fila).
+    """
+    lo, hi = _day_bounds(sketches['cells'], start_date, end_date)
+    cell_codes, uniques = pd.factorize(sketches['cells']['Profesional'].to_numpy()[lo:hi])
+    uniques = np.asarray(uniques, dtype=object)
+    if professionals is not None:
+        keep = pd.Series(uniques).isin(professionals).to_numpy()
+        cell_codes = np.where(keep, np.cumsum(keep) - 1, -1)[cell_codes]
+        uniques = uniques[keep]
+
+    offsets = sketches['offsets']
+    register_codes = np.repeat(cell_codes, np.diff(offsets[lo:hi + 1]))
+    buckets = sketches['buckets'][offsets[lo]:offsets[hi]].astype(np.int64)
+    ranks = sketches['ranks'][offsets[lo]:offsets[hi]]
+    kept = register_codes >= 0
+
+    merged = np.zeros((len(uniques), 2 ** sketches['precision']), dtype=np.uint8)
+    np.maximum.at(merged, (register_codes[kept], buckets[kept]), ranks[kept])
+    return uniques, merged
+
+
+def hll_estimate(registers):
+    """Estimación HyperLogLog de elementos distintos para cada fila de registros (con corrección para rangos pequeños)."""
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimates = alpha * m * m / np.exp2(-registers.astype(np.float64)).sum(axis=1)
+    zeros = (registers == 0).sum(axis=1)
+    small = (estimates <= 2.5 * m) & (zeros > 0)
+    estimates[small] = m * np.log(m / zeros[small])
+    return estimates
+
+
+# 9. Facetas por clasificación de novedad
+CLASSIFICATION_COLUMN = 'CLASIFICACION DE NOVEDAD'
+# Etiqueta de las novedades sin clasificación (o de archivos sin la columna)
+UNCLASSIFIED_LABEL = 'SIN CLASIFICACIÓN'
+FACET_COLUMNS = ['FECHA_DIA', 'Profesional', 'Clasificación']
+# Columnas de las novedades que necesitan las facetas
+FACET_SOURCE_COLUMNS = (['FECHA DE REGISTRO DE NOVEDAD', CLASSIFICATION_COLUMN]
+                        + [source_col for source_col, _ in ACTIVITY_SOURCE_COLUMNS])
+
+
+def _classification_labels(df):
+    """Clasificación de cada fila como categórico, con las vacías agrupadas en UNCLASSIFIED_LABEL."""
+    if CLASSIFICATION_COLUMN not in df.columns:
+        return pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=[UNCLASSIFIED_LABEL])
+    values = df[CLASSIFICATION_COLUMN].astype('category')
+    # Se limpia el diccionario del categórico, no cada fila; el código -1 (nulo) toma la última etiqueta
+    labels = values.cat.categories.astype(str).str.strip()
+    labels = np.append(labels.where(labels != '', UNCLASSIFIED_LABEL).to_numpy(dtype=object), UNCLASSIFIED_LABEL)
+    label_codes, label_uniques = pd.factorize(labels)
+    return pd.Categorical.from_codes(label_codes[values.cat.codes.to_numpy()], categories=label_uniques)
+
+
+def empty_classification_facets():
+    """Facetas sin actividades, con las columnas y tipos de build_classification_facets."""
+    return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in
+                         [('FECHA_DIA', 'datetime64[ns]'), ('Profesional', 'category'),
+                          ('Clasificación', 'category')] + [(activity, 'int64') for activity in ACTIVITY_TYPES]})
+
+
+def build_classification_facets(df):
+    """
+    Conteos de actividades por día, profesional y clasificación de novedad, con una columna
+    por tipo de actividad (ordenados por FECHA_DIA). Igual que el cubo de agregados, permite
+    responder cualquier combinación de fechas, profesionales y clasificaciones sin volver a
+    las filas de novedades.
+    """
+    days = pd.to_datetime(df['FECHA DE REGISTRO DE NOVEDAD']).dt.normalize().to_numpy()
+    classifications = _classification_labels(df)
+    parts = []
+    for source_col, activity in ACTIVITY_SOURCE_COLUMNS:
+        if source_col not in df.columns:
+            continue
+        responsables = df[source_col]
+        mask = (responsables.notna() & (responsables != '')).to_numpy()
+        if not mask.any():
+            continue
+        part = pd.DataFrame({'FECHA_DIA': days[mask], 'Profesional': responsables[mask].to_numpy(),
+                             'Clasificación': classifications[mask]})
+        counts = part.groupby(FACET_COLUMNS, observed=True).size().rename(activity).reset_index()
+        counts['Profesional'] = counts['Profesional'].astype(str)
+        counts['Clasificación'] = counts['Clasificación'].astype(str)
+        parts.append(counts)
+
+    if not parts:
+        return empty_classification_facets()
+
+    facets = pd.concat(parts, ignore_index=True)
+    facets = facets.groupby(FACET_COLUMNS, sort=True)[[a for a in ACTIVITY_TYPES if a in facets.columns]].sum()
+    facets = facets.reindex(columns=ACTIVITY_TYPES, fill_value=0).fillna(0).astype('int64').reset_index()
+    facets['Profesional'] = facets['Profesional'].astype('category')
+    facets['Clasificación'] = facets['Clasificación'].astype('category')
+    return facets
+
+
+def merge_facets(parts):
+    """Suma varias tablas de facetas (por ejemplo, las de un mes persistido y las de sus filas nuevas)."""
+    parts = [part for part in parts if not part.empty]
+    if not parts:
+        return empty_classification_facets()
+    facets = pd.concat([part.astype({'Profesional': str, 'Clasificación': str}) for part in parts],
+                       ignore_index=True)
+    facets = facets.groupby(FACET_COLUMNS, sort=True)[ACTIVITY_TYPES].sum().astype('int64').reset_index()
+    return facets.astype({'Profesional': 'category', 'Clasificación': 'category'})
+
+
+def upload_facets_path(cache_key):
+    """Ruta de las facetas de un archivo subido, calculadas al guardarlo en la caché de conversión."""
+    return os.path.join(FACETS_DIR, f"{cache_key}.parquet")
+
+
+def save_facets(facets, path, max_bytes=FACETS_MAX_BYTES):
+    """
+    Escribe las facetas en Parquet; retorna False si no se pudo (los desgloses siguen en
+    memoria). Con max_bytes=None el directorio no se trata como caché.
+    """
+    return write_file_atomic(path, lambda tmp_path: facets.to_parquet(tmp_path, index=False), max_bytes)
+
+
+def load_facets(path):
+    """Lee facetas guardadas con save_facets, o retorna None si no existen o están dañadas."""
+    try:
+        facets = pd.read_parquet(path)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    if list(facets.columns) != FACET_COLUMNS + ACTIVITY_TYPES:
+        return None
+    return facets
+
+
+def dataset_facets_dir(dataset_dir):
+    """Facetas por partición de un conjunto particionado: junto al conjunto, fuera de su árbol de archivos."""
+    return f"{os.path.normpath(dataset_dir)}_facetas"
+
+
+def _partition_dir(dataset_dir, year, month):
+    return os.path.join(dataset_dir, f"ANIO={year}", f"MES={month}")
+
+
+def _partition_facets_path(dataset_dir, year, month):
+    """
+    Facetas de la partición ANIO/MES, nombradas por la versión de sus archivos (file_version):
+    si la partición cambia por fuera de append_to_dataset, las facetas anteriores dejan de valer.
+    """
+    version = hashlib.sha256(file_version(_partition_dir(dataset_dir, year, month)).encode()).hexdigest()[:16]
+    return os.path.join(dataset_facets_dir(dataset_dir), f"ANIO={year}", f"MES={month}", f"{version}.parquet")
+
+
+def _load_partition_facets(dataset_dir, year, month):
+    """Facetas vigentes de la partición, o None si no se calcularon para su versión actual."""
+    path = _partition_facets_path(dataset_dir, year, month)
+    return load_facets(path) if os.path.exists(path) else None
+
+
+def _store_partition_facets(facets, dataset_dir, year, month):
+    """Guarda las facetas de la versión actual de la partición y descarta las de versiones anteriores."""
+    path = _partition_facets_path(dataset_dir, year, month)
+    if not save_facets(facets, path, max_bytes=None):
+        return
+    for stale_path in glob.glob(os.path.join(os.path.dirname(path), '*.parquet')):
+        if stale_path != path:
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+
+
+def _partition_facets(dataset_dir, year, month):
+    """Facetas de una partición; las que faltan (meses guardados antes de calcularlas) se calculan una vez."""
+    facets = _load_partition_facets(dataset_dir, year, month)
+    if facets is None:
+        df = load_dataframe(_partition_dir(dataset_dir, year, month), columns=FACET_SOURCE_COLUMNS)
+        facets = build_classification_facets(df)
+        _store_partition_facets(facets, dataset_dir, year, month)
+    return facets
+
+
+def load_dataset_facets(source, date_range=None):
+    """
+    Facetas de clasificación del histórico persistido para los meses de 'date_range' (por
+    defecto, todos). En el conjunto particionado se combinan las facetas que append_to_dataset
+    guarda por partición, sin leer las novedades; un archivo único se resume desde sus filas.
+    """
+    if not os.path.isdir(source):
+        return build_classification_facets(load_dataframe(source, columns=FACET_SOURCE_COLUMNS,
+                                                          date_range=date_range))
+    months = None
+    if date_range is not None:
+        months = {(period.year, period.month)
+                  for period in pd.period_range(pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1]), freq='M')}
+    partitions = []
+    for partition_dir in glob.glob(os.path.join(source, 'ANIO=*', 'MES=*')):
+        year = int(os.path.basename(os.path.dirname(partition_dir)).split('=', 1)[1])
+        month = int(os.path.basename(partition_dir).split('=', 1)[1])
+        if months is None or (year, month) in months:
+            partitions.append((year, month))
+    return merge_facets([_partition_facets(source, year, month) for year, month in sorted(partitions)])
+
+
+def _select_facets(facets, start_date, end_date, professionals=None, classifications=None):
+    facets = _slice_days(facets, start_date, end_date)
+    if professionals is not None:
+        facets = facets[facets['Profesional'].isin(professionals)]
+    if classifications is not None:
+        facets = facets[facets['Clasificación'].isin(classifications)]
+    return facets
+
+
+def facet_classifications(facets, start_date, end_date, professionals=None):
+    """Clasificaciones con actividad en el rango de fechas (y profesionales), en orden alfabético."""
+    selected = _select_facets(facets, start_date, end_date, professionals)
+    return sorted(selected['Clasificación'].astype(str).unique())
+
+
+def classification_breakdown(facets, start_date, end_date, by='Profesional', professionals=None,
+                             classifications=None, activity_types=None):
+    """
+    Actividades por clasificación: una fila por profesional (by='Profesional') o por día
+    (by='FECHA_DIA', como fecha) y una columna por clasificación, de la más a la menos
+    frecuente. 'activity_types' limita los tipos de actividad sumados (por defecto, todos).
+    """
+    selected = _select_facets(facets, start_date, end_date, professionals, classifications)
+    activities = selected[list(activity_types or ACTIVITY_TYPES)].sum(axis=1)
+    breakdown = activities.groupby([selected[by], selected['Clasificación']], observed=True).sum().unstack(
+        fill_value=0)
+    breakdown = breakdown.loc[:, breakdown.sum().sort_values(ascending=False, kind='stable').index]
+    breakdown.columns = breakdown.columns.astype(str)
+    breakdown.columns.name = 'Clasificación'
+    breakdown.index = breakdown.index.date if by == 'FECHA_DIA' else breakdown.index.astype(str)
+    breakdown.index.name = by
+    return breakdown.astype('int64').reset_index()
+
+
+def classification_activity_totals(facets, start_date, end_date, professionals=None, classifications=None):
+    """Totales por clasificación y tipo de actividad en el rango, de la clasificación más a la menos frecuente."""
+    selected = _select_facets(facets, start_date, end_date, professionals, classifications)
+    totals = selected.groupby('Clasificación', observed=True)[ACTIVITY_TYPES].sum()
+    totals['Total'] = totals.sum(axis=1)
+    totals.index = totals.index.astype(str)
+    return totals.sort_values('Total', ascending=False, kind='stable').astype('int64').reset_index()
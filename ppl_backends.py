@@ -0,0 +1,225 @@
+"""
+Motores de consulta para los agregados del dashboard.
+
+Un motor responde las consultas de la página sobre un rango de fechas: profesionales con
+actividad, resumen por profesional, totales de un grupo ("Otros") y conteos diarios de un
+profesional. Hay dos implementaciones con los mismos resultados:
+
+- 'pandas' (por defecto): consulta el cubo de agregados de ppl_analytics en memoria.
+- 'duckdb' (opcional, `pip install duckdb`): ejecuta SQL multihilo directamente sobre el
+  histórico Parquet, sin materializar el DataFrame completo.
+
+Ambos admiten un modo aproximado para los pacientes únicos (approximate=True): el cubo guarda
+sketches HyperLogLog por profesional y día (ver ppl_analytics, sección 8) y DuckDB usa
+approx_count_distinct. Los conteos de actividades siguen siendo exactos.
+
+DuckDBBackend también calcula las facetas de clasificación (ppl_analytics, sección 9), para
+que la página no necesite las filas en pandas con ese motor.
+
+check_backend_parity compara dos motores consulta por consulta; ppl_benchmark y las pruebas
+lo usan para verificar la paridad sobre datos sintéticos.
+"""
+import glob
+import os
+
+import pandas as pd
+
+from ppl_analytics import (ACTIVITY_SOURCE_COLUMNS, ACTIVITY_TYPES, CLASSIFICATION_COLUMN, DASHBOARD_COLUMNS,
+                           FACET_COLUMNS, UNCLASSIFIED_LABEL, _format_daily_counts, build_activity_cube,
+                           build_unified_activity, cube_date_bounds, cube_professionals, daily_activity_counts,
+                           empty_classification_facets, load_dataframe, others_aggregate, summarize_professionals)
+
+# Motor de consultas de la página: 'pandas' (por defecto) o 'duckdb'
+QUERY_BACKEND = os.environ.get('PPL_QUERY_BACKEND', 'pandas')
+
+
+def _sql_literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+class PandasBackend:
+    """Consultas sobre el cubo de agregados en memoria (build_activity_cube)."""
+
+    name = 'pandas'
+
+    def __init__(self, cube):
+        self.cube = cube
+
+    @classmethod
+    def from_source(cls, source, date_range=None, approximate=False):
+        """Carga el histórico persistido (sólo las columnas del dashboard) y construye el cubo."""
+        df = load_dataframe(source, columns=DASHBOARD_COLUMNS, date_range=date_range)
+        return cls(build_activity_cube(build_unified_activity(df), approximate=approximate))
+
+    def date_bounds(self):
+        """Primera y última fecha con actividad, o None si no hay actividades."""
+        return None if self.cube['counts'].empty else cube_date_bounds(self.cube)
+
+    def professionals(self, start_date, end_date):
+        return cube_professionals(self.cube, start_date, end_date)
+
+    def summary(self, start_date, end_date, professionals=None):
+        return summarize_professionals(self.cube, start_date, end_date, professionals)
+
+    def others(self, start_date, end_date, professionals):
+        return others_aggregate(self.cube, start_date, end_date, professionals)
+
+    def daily_counts(self, professional, start_date, end_date):
+        return daily_activity_counts(self.cube, professional, start_date, end_date)
+
+
+class DuckDBBackend:
+    """
+    Consultas SQL sobre el histórico Parquet (conjunto particionado o archivo único). DuckDB
+    sólo lee las columnas y los grupos de filas que cada consulta necesita, en paralelo con
+    'threads' hilos (por defecto, todos los núcleos). Con approximate=True los pacientes únicos
+    se estiman con approx_count_distinct, el HyperLogLog propio de DuckDB: su error es mayor que
+    el de los sketches del cubo (HLL_STANDARD_ERROR) y no es configurable.
+    """
+
+    name = 'duckdb'
+
+    def __init__(self, source, threads=None, approximate=False):
+        import duckdb
+
+        self._distinct = "approx_count_distinct(paciente)" if approximate else "COUNT(DISTINCT paciente)"
+        config = {} if threads is None else {'threads': int(threads)}
+        self._connection = duckdb.connect(config=config)
+        # Las vistas no admiten parámetros: las rutas van como literales SQL escapados
+        if os.path.isdir(source):
+            files = sorted(glob.glob(os.path.join(source, '**', '*.parquet'), recursive=True))
+            # union_by_name: las columnas opcionales pueden faltar en algunos archivos
+            scan = (f"read_parquet([{', '.join(map(_sql_literal, files))}], hive_partitioning = true, "
+                    f"union_by_name = true)")
+        else:
+            scan = f"read_parquet({_sql_literal(source)})"
+        self._connection.execute(f"CREATE VIEW novedades AS SELECT * FROM {scan}")
+        columns = {row[0] for row in self._connection.execute("DESCRIBE novedades").fetchall()}
+        # Clasificación de novedad con las mismas etiquetas que las facetas de ppl_analytics
+        unclassified = _sql_literal(UNCLASSIFIED_LABEL)
+        classification = (f"""COALESCE(NULLIF(trim("{CLASSIFICATION_COLUMN}"), ''), {unclassified})"""
+                          if CLASSIFICATION_COLUMN in columns else unclassified)
+        # Formato unificado como vista: una fila por actividad (Registro y/o Auditoría)
+        selects = [
+            f"""SELECT "{source_col}" AS profesional, '{activity}' AS tipo,
+                       "IDENTIFICACIÓN DEL PPL" AS paciente, "FECHA DE REGISTRO DE NOVEDAD" AS fecha,
+                       {classification} AS clasificacion
+                FROM novedades
+                WHERE "{source_col}" IS NOT NULL AND "{source_col}" <> ''
+                  AND "FECHA DE REGISTRO DE NOVEDAD" IS NOT NULL"""
+            for source_col, activity in ACTIVITY_SOURCE_COLUMNS if source_col in columns
+        ]
+        self._connection.execute(f"CREATE VIEW actividades AS {' UNION ALL '.join(selects)}")
+
+    def _execute(self, sql, params=()):
+        """Ejecuta 'sql' y retorna el resultado como DataFrame."""
+        # Un cursor por consulta: varias sesiones de Streamlit pueden consultar a la vez
+        cursor = self._connection.cursor()
+        try:
+            return cursor.execute(sql, list(params)).df()
+        finally:
+            cursor.close()
+
+    def _query(self, sql, start_date, end_date, *params):
+        """Ejecuta 'sql' (con ?-parámetros después del rango) restringido al rango de fechas inclusivo."""
+        window = (pd.Timestamp(start_date).to_pydatetime(),
+                  (pd.Timestamp(end_date) + pd.Timedelta(days=1)).to_pydatetime())
+        return self._execute(sql.format(rango="fecha >= ? AND fecha < ?"), [*window, *params])
+
+    def date_bounds(self):
+        bounds = self._execute("SELECT MIN(fecha) AS inicio, MAX(fecha) AS fin FROM actividades")
+        if pd.isna(bounds['inicio'].iloc[0]):
+            return None
+        return bounds['inicio'].iloc[0].date(), bounds['fin'].iloc[0].date()
+
+    def professionals(self, start_date, end_date):
+        result = self._query("SELECT DISTINCT profesional FROM actividades WHERE {rango}", start_date, end_date)
+        return sorted(result['profesional'])
+
+    def summary(self, start_date, end_date, professionals=None):
+        selected = "" if professionals is None else "AND profesional IN (SELECT UNNEST(?))"
+        params = () if professionals is None else (list(professionals),)
+        summary = self._query(f"""
+            SELECT profesional AS "Profesional", {self._distinct} AS pacientes_unicos_total,
+                   COUNT(*) AS actividades_totales
+            FROM actividades WHERE {{rango}} {selected}
+            GROUP BY profesional ORDER BY profesional""", start_date, end_date, *params)
+        return summary.astype({'pacientes_unicos_total': 'int64', 'actividades_totales': 'int64'})
+
+    def others(self, start_date, end_date, professionals):
+        if len(professionals) == 0:
+            return None
+        pacientes, actividades = self._query(f"""
+            SELECT {self._distinct} AS pacientes, COUNT(*) AS actividades
+            FROM actividades WHERE {{rango}} AND profesional IN (SELECT UNNEST(?))""",
+                                             start_date, end_date, list(professionals)).iloc[0]
+        return {'profesionales': len(professionals), 'pacientes_unicos_total': int(pacientes),
+                'actividades_totales': int(actividades)}
+
+    def daily_counts(self, professional, start_date, end_date):
+        daily = self._query("""
+            SELECT date_trunc('day', fecha) AS "FECHA_DIA", tipo, COUNT(*) AS n
+            FROM actividades WHERE {rango} AND profesional = ?
+            GROUP BY ALL""", start_date, end_date, professional)
+        daily = daily.pivot_table(index='FECHA_DIA', columns='tipo', values='n', aggfunc='sum', fill_value=0)
+        daily = daily.reindex(columns=ACTIVITY_TYPES, fill_value=0).astype('int64').sort_index().reset_index()
+        daily['FECHA_DIA'] = pd.to_datetime(daily['FECHA_DIA']).astype('datetime64[ns]')
+        return _format_daily_counts(daily)
+
+    def classification_facets(self):
+        """
+        Facetas de clasificación de todo el origen, con el formato de build_classification_facets
+        de ppl_analytics: la página las filtra por fechas y profesionales sin cargar las filas en pandas.
+        """
+        facets = self._execute("""
+            SELECT date_trunc('day', fecha) AS "FECHA_DIA", profesional AS "Profesional",
+                   clasificacion AS "Clasificación", tipo, COUNT(*) AS n
+            FROM actividades GROUP BY ALL""")
+        if facets.empty:
+            return empty_classification_facets()
+        facets = facets.pivot_table(index=FACET_COLUMNS, columns='tipo', values='n', aggfunc='sum', fill_value=0)
+        facets = facets.reindex(columns=ACTIVITY_TYPES, fill_value=0).astype('int64').sort_index().reset_index()
+        facets.columns.name = None
+        return facets.astype({'Profesional': 'category', 'Clasificación': 'category'})
+
+
+BACKENDS = {'pandas': PandasBackend, 'duckdb': DuckDBBackend}
+
+
+def open_backend(name, source, approximate=False):
+    """Motor 'name' sobre el histórico Parquet 'source' (conjunto particionado o archivo único)."""
+    if name == 'pandas':
+        return PandasBackend.from_source(source, approximate=approximate)
+    return BACKENDS[name](source, approximate=approximate)
+
+
+def check_backend_parity(reference, candidate, start_date, end_date, professionals=None):
+    """
+    Ejecuta las consultas del dashboard en ambos motores y retorna la lista de diferencias
+    (vacía si coinciden). Los resúmenes se comparan ordenados por profesional.
+    'professionals' limita los conteos diarios a esos profesionales (por defecto, todos).
+    """
+    differences = []
+    if reference.date_bounds() != candidate.date_bounds():
+        differences.append(f"límites de fechas: {reference.date_bounds()} != {candidate.date_bounds()}")
+
+    expected_professionals = reference.professionals(start_date, end_date)
+    if candidate.professionals(start_date, end_date) != expected_professionals:
+        differences.append("profesionales del rango")
+
+    def sorted_summary(backend, selection=None):
+        summary = backend.summary(start_date, end_date, selection)
+        return summary.sort_values('Profesional', kind='stable').reset_index(drop=True)
+
+    half = expected_professionals[::2]
+    for label, selection in (('todos', None), ('selección', half)):
+        if not sorted_summary(reference, selection).equals(sorted_summary(candidate, selection)):
+            differences.append(f"resumen por profesional ({label})")
+    if reference.others(start_date, end_date, half) != candidate.others(start_date, end_date, half):
+        differences.append("totales de Otros")
+
+    for professional in (expected_professionals if professionals is None else professionals):
+        expected = reference.daily_counts(professional, start_date, end_date)
+        if not expected.equals(candidate.daily_counts(professional, start_date, end_date)):
+            differences.append(f"conteos diarios de {professional}")
+    return differences
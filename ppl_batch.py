@@ -0,0 +1,158 @@
+"""
+Generación por lotes de los reportes de Evolución Diaria Detallada.
+
+Calcula en una sola pasada los conteos diarios de Registro y Auditoría de todos los
+profesionales y reparte el dibujo de las gráficas (PNG) y la escritura de las tablas
+(CSV/XLSX) en un pool de procesos. Al final informa el tiempo de cada etapa.
+
+Uso:
+    python ppl_batch.py [archivo.xlsx|archivo.csv] [--hoja HOJA] [--desde AAAA-MM-DD]
+                        [--hasta AAAA-MM-DD] [--salida DIR] [--formato csv xlsx] [--procesos N]
+
+Sin archivo de entrada se usa el histórico persistido por el dashboard.
+"""
+import argparse
+import datetime
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ppl_analytics import (DASHBOARD_COLUMNS, DEFAULT_SHEET_NAME, PRODUCTIVITY_DATASET_DIR, PRODUCTIVITY_FILE,
+                           build_activity_cube, build_unified_activity, cube_date_bounds,
+                           daily_activity_counts_by_professional, load_dataframe, load_uploaded_data,
+                           prepare_productivity_frame)
+
+TABLE_FORMATS = ('csv', 'xlsx')
+
+
+def _init_worker():
+    """Los procesos del pool dibujan sin pantalla."""
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def report_filename(professional):
+    """Nombre de archivo seguro para un profesional (sin separadores ni caracteres especiales)."""
+    return re.sub(r'[^\w.-]+', '_', professional, flags=re.UNICODE).strip('_') or 'profesional'
+
+
+def render_professional_report(professional, daily, output_path, formats):
+    """
+    Escribe la gráfica PNG y las tablas de un profesional con 'output_path' como prefijo.
+    Retorna los segundos empleados. Se ejecuta dentro de un proceso del pool.
+    """
+    from ppl_charts import figure_to_png, plot_daily_activity
+
+    started = time.perf_counter()
+    png = figure_to_png(plot_daily_activity(daily, professional), dpi=100, bbox_inches=None)
+    with open(f"{output_path}.png", 'wb') as png_file:
+        png_file.write(png)
+
+    if 'csv' in formats:
+        daily.to_csv(f"{output_path}.csv", index=False)
+    if 'xlsx' in formats:
+        daily.to_excel(f"{output_path}.xlsx", index=False, sheet_name='Evolución Diaria')
+    return time.perf_counter() - started
+
+
+def load_source(input_path, sheet_name, date_range):
+    """DataFrame normalizado desde un archivo CSV/Excel o, si no se indica, desde el histórico persistido."""
+    if input_path is not None:
+        with open(input_path, 'rb') as source_file:
+            df, missing_cols = prepare_productivity_frame(
+                load_uploaded_data(source_file.read(), os.path.basename(input_path), sheet_name))
+        if missing_cols:
+            raise ValueError(f"Faltan columnas requeridas en '{input_path}': {', '.join(missing_cols)}")
+        return df
+
+    source = PRODUCTIVITY_DATASET_DIR if os.path.isdir(PRODUCTIVITY_DATASET_DIR) else PRODUCTIVITY_FILE
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"No hay archivo de entrada ni histórico persistido en {source}")
+    return load_dataframe(source, columns=DASHBOARD_COLUMNS,
+                          date_range=date_range if None not in date_range else None)
+
+
+def run_batch(input_path=None, sheet_name=DEFAULT_SHEET_NAME, start_date=None, end_date=None,
+              output_dir='reportes', formats=('csv',), workers=None):
+    """
+    Genera los reportes de todos los profesionales y retorna (archivos por profesional, tiempos por etapa).
+    Los tiempos son un dict {etapa: segundos} en el orden en que se ejecutaron.
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    df = load_source(input_path, sheet_name, (start_date, end_date))
+    timings['carga'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    cube = build_activity_cube(build_unified_activity(df))
+    timings['formato unificado y cubo'] = time.perf_counter() - started
+    if cube['counts'].empty:
+        return {}, timings
+
+    min_date, max_date = cube_date_bounds(cube)
+    start_date = start_date or min_date
+    end_date = end_date or max_date
+
+    started = time.perf_counter()
+    daily_by_professional = daily_activity_counts_by_professional(cube, start_date, end_date)
+    timings['conteos diarios'] = time.perf_counter() - started
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_paths = {}
+    used_names = set()
+    for professional in daily_by_professional:
+        name = report_filename(professional)
+        while name in used_names:
+            name += '_'
+        used_names.add(name)
+        output_paths[professional] = os.path.join(output_dir, name)
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {professional: pool.submit(render_professional_report, professional, daily,
+                                             output_paths[professional], tuple(formats))
+                   for professional, daily in daily_by_professional.items()}
+        render_seconds = sum(future.result() for future in futures.values())
+    timings['gráficas y tablas'] = time.perf_counter() - started
+    timings['gráficas y tablas (suma por profesional)'] = render_seconds
+
+    return output_paths, timings
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reportes de Evolución Diaria Detallada para todos los profesionales.")
+    parser.add_argument('entrada', nargs='?', help="Archivo CSV o Excel; sin él se usa el histórico persistido.")
+    parser.add_argument('--hoja', default=DEFAULT_SHEET_NAME, help="Hoja de Excel a cargar.")
+    parser.add_argument('--desde', type=_parse_date, help="Fecha inicial (AAAA-MM-DD).")
+    parser.add_argument('--hasta', type=_parse_date, help="Fecha final (AAAA-MM-DD).")
+    parser.add_argument('--salida', default='reportes', help="Directorio de salida.")
+    parser.add_argument('--formato', nargs='+', choices=TABLE_FORMATS, default=['csv'],
+                        help="Formatos de las tablas diarias.")
+    parser.add_argument('--procesos', type=int, default=os.cpu_count(), help="Procesos del pool de dibujo.")
+    args = parser.parse_args(argv)
+
+    if args.desde and args.hasta and args.desde > args.hasta:
+        parser.error("La fecha de inicio no puede ser posterior a la fecha de fin.")
+
+    output_paths, timings = run_batch(args.entrada, args.hoja, args.desde, args.hasta, args.salida,
+                                      args.formato, args.procesos)
+    if not output_paths:
+        print("No se encontraron profesionales con actividad para el rango indicado.")
+        return 1
+
+    print(f"{len(output_paths)} reportes escritos en {os.path.abspath(args.salida)} "
+          f"({args.procesos} procesos)")
+    for stage, seconds in timings.items():
+        print(f"  {stage:<42} {seconds:8.2f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,372 @@
+"""
+Benchmark por etapas del pipeline del dashboard sobre datos sintéticos.
+
+Para cada volumen de filas genera un archivo de novedades (ppl_synthetic) y mide por
+separado: lectura del archivo subido, normalización, guardado y carga Parquet, filtro de
+fechas, formato unificado (frente al recorrido iterrows al que reemplazó), agregaciones
+(con pacientes únicos exactos y aproximados, incluida la memoria del cubo y el error de la
+aproximación), facetas por clasificación, dibujo de gráficas y las consultas de cada motor
+(ppl_backends) sobre el Parquet. Con más de un motor también verifica que todos den los
+mismos resultados que el primero. Los resultados se guardan en JSON junto con el commit y
+las versiones de las librerías, para comparar entre commits.
+
+Uso:
+    python ppl_benchmark.py [--filas 10000 100000] [--formatos csv xlsx] [--repeticiones 3]
+                            [--motores pandas duckdb] [--salida benchmark_results]
+                            [--comparar resultados_anteriores.json]
+
+    La aceleración del formato unificado de 10k a 1M filas se reproduce con:
+    python ppl_benchmark.py --filas 10000 100000 1000000 --formatos csv --repeticiones 1
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow
+
+from ppl_analytics import (DASHBOARD_COLUMNS, DEFAULT_SHEET_NAME, append_to_dataset, build_activity_cube,
+                           build_classification_facets, build_unified_activity, classification_breakdown,
+                           cube_date_bounds, daily_activity_counts_by_professional, dataset_facets_dir,
+                           filter_by_date, load_dataframe, load_dataset_facets, load_uploaded_data,
+                           prepare_productivity_frame, summarize_professionals)
+from ppl_backends import BACKENDS, check_backend_parity, open_backend
+from ppl_synthetic import generate_novedades
+
+# Una regresión es una etapa cuyo mejor tiempo crece más que este factor frente a la referencia
+# y además en más de REGRESSION_MIN_SECONDS (las etapas de milisegundos son ruidosas)
+REGRESSION_FACTOR = 1.2
+REGRESSION_MIN_SECONDS = 0.01
+
+
+def _measure(func, repeats, setup=None):
+    """
+    Ejecuta 'func' 'repeats' veces y retorna (tiempos en segundos, último resultado). Si hay
+    'setup', se llama antes de cada repetición (fuera del tiempo medido) y su resultado se pasa a 'func'.
+    """
+    seconds = []
+    result = None
+    for _ in range(repeats):
+        argument = setup() if setup is not None else None
+        started = time.perf_counter()
+        result = func(argument) if setup is not None else func()
+        seconds.append(time.perf_counter() - started)
+    return seconds, result
+
+
+def unified_activity_reference(df):
+    """
+    Formato unificado con el recorrido fila por fila (iterrows) que build_unified_activity
+    reemplazó. Se conserva como referencia de equivalencia y de tiempo.
+    """
+    unified_data = []
+    for _, row in df.iterrows():
+        if 'RESPONSABLE DEL REGISTRO' in row and pd.notna(row['RESPONSABLE DEL REGISTRO']) and row[
+                'RESPONSABLE DEL REGISTRO'] != '':
+            unified_data.append({
+                'Profesional': row['RESPONSABLE DEL REGISTRO'],
+                'Tipo_Actividad': 'Registro',
+                'IDENTIFICACIÓN DEL PPL': row['IDENTIFICACIÓN DEL PPL'],
+                'FECHA DE REGISTRO DE NOVEDAD': row['FECHA DE REGISTRO DE NOVEDAD']
+            })
+        if 'RESPONSABLE AUDITORIA' in row and pd.notna(row['RESPONSABLE AUDITORIA']) and row[
+                'RESPONSABLE AUDITORIA'] != '':
+            unified_data.append({
+                'Profesional': row['RESPONSABLE AUDITORIA'],
+                'Tipo_Actividad': 'Auditoría',
+                'IDENTIFICACIÓN DEL PPL': row['IDENTIFICACIÓN DEL PPL'],
+                'FECHA DE REGISTRO DE NOVEDAD': row['FECHA DE REGISTRO DE NOVEDAD']
+            })
+    if not unified_data:
+        return pd.DataFrame(columns=['Profesional', 'Tipo_Actividad', 'IDENTIFICACIÓN DEL PPL',
+                                     'FECHA DE REGISTRO DE NOVEDAD'])
+    df_unified = pd.DataFrame(unified_data)
+    df_unified['Profesional'] = df_unified['Profesional'].astype(str)
+    df_unified['IDENTIFICACIÓN DEL PPL'] = df_unified['IDENTIFICACIÓN DEL PPL'].astype(str)
+    return df_unified
+
+
+def _output_rows(result):
+    """Filas de la salida de una etapa, cuando tiene sentido contarlas."""
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if isinstance(result, dict) and 'counts' in result:
+        return len(result['counts'])
+    if isinstance(result, dict):
+        return len(result)
+    return None
+
+
+def _nbytes(value):
+    """Memoria ocupada por un cubo de agregados (o cualquier anidación de tablas y arreglos), en bytes."""
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    return int(getattr(value, 'nbytes', 0))
+
+
+def _file_bytes(df_raw, file_format):
+    buffer = io.BytesIO()
+    if file_format == 'xlsx':
+        df_raw.to_excel(buffer, sheet_name=DEFAULT_SHEET_NAME, index=False, engine='openpyxl')
+    else:
+        df_raw.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+def benchmark_volume(rows, formats, repeats, workdir, backends=('pandas',), **generator_options):
+    """Mide todas las etapas para un volumen de filas y retorna una lista de resultados por etapa."""
+    import matplotlib
+    matplotlib.use('Agg')
+    from ppl_charts import chart_key, figure_to_png, plot_daily_activity, plot_professional_ranking
+
+    results = []
+
+    def record(stage, seconds, result):
+        results.append({
+            'filas': rows,
+            'etapa': stage,
+            'mejor_s': min(seconds),
+            'mediana_s': statistics.median(seconds),
+            'repeticiones': len(seconds),
+            'filas_salida': _output_rows(result),
+        })
+
+    df_raw = generate_novedades(rows, **generator_options)
+
+    # 1. Lectura del archivo subido, en cada formato
+    df_loaded = None
+    for file_format in formats:
+        file_bytes = _file_bytes(df_raw, file_format)
+        seconds, loaded = _measure(
+            lambda: load_uploaded_data(file_bytes, f"novedades.{file_format}", DEFAULT_SHEET_NAME), repeats)
+        record(f"lectura_{file_format}", seconds, loaded)
+        df_loaded = loaded if df_loaded is None else df_loaded
+
+    # 2. Normalización al esquema canónico (prepare_productivity_frame modifica su entrada)
+    seconds, (df, _) = _measure(prepare_productivity_frame, repeats, setup=df_loaded.copy)
+    record('normalizacion', seconds, df)
+
+    # 3. Persistencia Parquet particionada
+    dataset_dir = os.path.join(workdir, 'productividad')
+
+    def fresh_dataset_dir():
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+        shutil.rmtree(dataset_facets_dir(dataset_dir), ignore_errors=True)
+        return df
+
+    seconds, saved = _measure(lambda frame: append_to_dataset(frame, dataset_dir), repeats, setup=fresh_dataset_dir)
+    record('parquet_guardado', seconds, saved)
+
+    seconds, loaded = _measure(lambda: load_dataframe(dataset_dir, columns=DASHBOARD_COLUMNS), repeats)
+    record('parquet_carga', seconds, loaded)
+
+    last_day = df['FECHA DE REGISTRO DE NOVEDAD'].max().date()
+    week = (last_day - datetime.timedelta(days=6), last_day)
+    seconds, loaded = _measure(lambda: load_dataframe(dataset_dir, columns=DASHBOARD_COLUMNS, date_range=week),
+                               repeats)
+    record('parquet_carga_ultima_semana', seconds, loaded)
+
+    # 4. Filtro de fechas y formato unificado
+    seconds, filtered = _measure(lambda: filter_by_date(df, *week), repeats)
+    record('filtro_fechas_ultima_semana', seconds, filtered)
+
+    seconds, df_unified = _measure(lambda: build_unified_activity(df), repeats)
+    record('formato_unificado', seconds, df_unified)
+
+    # Referencia: el recorrido iterrows anterior (una sola repetición; tarda ~1 min por millón de filas)
+    seconds, _ = _measure(lambda: unified_activity_reference(df), 1)
+    record('formato_unificado_iterrows', seconds, None)
+    results[-1]['aceleracion'] = results[-1]['mejor_s'] / results[-2]['mejor_s']
+
+    # 5. Agregaciones
+    seconds, cube = _measure(lambda: build_activity_cube(df_unified), repeats)
+    record('cubo_agregados', seconds, cube)
+    results[-1]['memoria_bytes'] = _nbytes(cube)
+
+    start_date, end_date = cube_date_bounds(cube)
+    seconds, summary = _measure(lambda: summarize_professionals(cube, start_date, end_date), repeats)
+    record('resumen_profesionales', seconds, summary)
+
+    # Pacientes únicos aproximados (HyperLogLog): memoria, latencia y error frente al conteo exacto
+    seconds, approximate_cube = _measure(lambda: build_activity_cube(df_unified, approximate=True), repeats)
+    record('cubo_agregados_aproximado', seconds, approximate_cube)
+    results[-1]['memoria_bytes'] = _nbytes(approximate_cube)
+
+    seconds, approximate = _measure(lambda: summarize_professionals(approximate_cube, start_date, end_date), repeats)
+    record('resumen_profesionales_aproximado', seconds, approximate)
+    exact_patients = summary.set_index('Profesional')['pacientes_unicos_total']
+    errors = (approximate.set_index('Profesional')['pacientes_unicos_total'] - exact_patients).abs() / exact_patients
+    results[-1]['error_relativo_max'] = float(errors.max())
+
+    # Facetas por clasificación de novedad y desglose de todos los profesionales por día
+    seconds, facets = _measure(lambda: build_classification_facets(df), repeats)
+    record('facetas_clasificacion', seconds, facets)
+    results[-1]['memoria_bytes'] = _nbytes(facets)
+
+    # Lo que hace la página: combinar las facetas que append_to_dataset guardó por partición
+    seconds, stored_facets = _measure(lambda: load_dataset_facets(dataset_dir), repeats)
+    record('facetas_particiones_lectura', seconds, stored_facets)
+
+    seconds, breakdown = _measure(lambda: classification_breakdown(facets, start_date, end_date, 'FECHA_DIA'), repeats)
+    record('desglose_clasificacion_diario', seconds, breakdown)
+
+    seconds, daily = _measure(lambda: daily_activity_counts_by_professional(cube, start_date, end_date), repeats)
+    record('conteos_diarios_todos', seconds, daily)
+
+    # 6. Gráficas (dibujo completo a PNG en memoria, como lo hace la página)
+    seconds, _ = _measure(lambda: figure_to_png(plot_professional_ranking(summary)), repeats)
+    record('grafica_ranking', seconds, summary)
+
+    # Costo de una selección ya vista: sólo se calcula la clave de la imagen cacheada
+    seconds, _ = _measure(lambda: chart_key('ranking', summary), repeats)
+    record('clave_grafica_ranking', seconds, summary)
+
+    top_professional = summary.sort_values('actividades_totales').iloc[-1]['Profesional']
+    seconds, _ = _measure(lambda: figure_to_png(plot_daily_activity(daily[top_professional], top_professional)),
+                          repeats)
+    record('grafica_evolucion_diaria', seconds, daily[top_professional])
+
+    # 7. Motores de consulta directamente sobre el Parquet persistido
+    opened = {}
+    for name in backends:
+        seconds, opened[name] = _measure(lambda: open_backend(name, dataset_dir), repeats)
+        record(f'motor_{name}_apertura', seconds, None)
+        backend = opened[name]
+        seconds, result = _measure(lambda: backend.summary(start_date, end_date), repeats)
+        record(f'motor_{name}_resumen', seconds, result)
+        seconds, result = _measure(lambda: backend.summary(*week), repeats)
+        record(f'motor_{name}_resumen_ultima_semana', seconds, result)
+        seconds, result = _measure(lambda: backend.daily_counts(top_professional, start_date, end_date), repeats)
+        record(f'motor_{name}_conteos_diarios', seconds, result)
+
+    reference_name = backends[0]
+    checked_professionals = summary.sort_values('actividades_totales')['Profesional'].iloc[[0, -1]].tolist()
+    for name in backends[1:]:
+        differences = []
+        for date_range in ((start_date, end_date), week):
+            differences.extend(check_backend_parity(opened[reference_name], opened[name], *date_range,
+                                                    professionals=checked_professionals))
+        record(f'paridad_{name}_vs_{reference_name}', [0.0], None)
+        results[-1]['diferencias'] = differences
+
+    return results
+
+
+def _git_commit():
+    """Commit actual del repositorio, o None si no se puede determinar."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(row_counts, formats=('csv',), repeats=3, backends=('pandas',), **generator_options):
+    """Ejecuta el benchmark para cada volumen y retorna el documento de resultados (serializable a JSON)."""
+    results = []
+    with tempfile.TemporaryDirectory(prefix='ppl_benchmark_') as workdir:
+        for rows in row_counts:
+            results.extend(benchmark_volume(rows, formats, repeats, workdir, backends, **generator_options))
+    return {
+        'commit': _git_commit(),
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'entorno': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'pyarrow': pyarrow.__version__,
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'parametros': {'filas': list(row_counts), 'formatos': list(formats), 'repeticiones': repeats,
+                       'motores': list(backends), **generator_options},
+        'resultados': results,
+    }
+
+
+def compare_results(current, baseline, factor=REGRESSION_FACTOR):
+    """
+    Compara el mejor tiempo de cada (filas, etapa) con una corrida de referencia.
+    Retorna una lista de (filas, etapa, segundos referencia, segundos actuales, razón, es_regresión).
+    """
+    reference = {(item['filas'], item['etapa']): item['mejor_s'] for item in baseline['resultados']}
+    comparison = []
+    for item in current['resultados']:
+        key = (item['filas'], item['etapa'])
+        if key not in reference:
+            continue
+        ratio = item['mejor_s'] / reference[key] if reference[key] > 0 else float('inf')
+        regression = ratio > factor and item['mejor_s'] - reference[key] > REGRESSION_MIN_SECONDS
+        comparison.append((*key, reference[key], item['mejor_s'], ratio, regression))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark por etapas del pipeline de productividad.")
+    parser.add_argument('--filas', type=int, nargs='+', default=[10_000, 100_000], help="Volúmenes a medir.")
+    parser.add_argument('--formatos', nargs='+', choices=['csv', 'xlsx'], default=['csv', 'xlsx'],
+                        help="Formatos de archivo subido a medir.")
+    parser.add_argument('--repeticiones', type=int, default=3, help="Repeticiones por etapa (se reporta la mejor).")
+    parser.add_argument('--motores', nargs='+', choices=list(BACKENDS), default=['pandas'],
+                        help="Motores de consulta a medir; el primero es la referencia de paridad.")
+    parser.add_argument('--profesionales', type=int, default=40)
+    parser.add_argument('--dias', type=int, default=31)
+    parser.add_argument('--auditadas', type=float, default=0.6)
+    parser.add_argument('--salida', default='benchmark_results', help="Directorio de los resultados JSON.")
+    parser.add_argument('--comparar', help="JSON de una corrida anterior contra el cual comparar.")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.filas, args.formatos, args.repeticiones, args.motores,
+                           professionals=args.profesionales, days=args.dias, audit_share=args.auditadas)
+
+    os.makedirs(args.salida, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    output_path = os.path.join(args.salida, f"{stamp}_{report['commit'] or 'sin-commit'}.json")
+    with open(output_path, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, ensure_ascii=False, indent=2)
+
+    for item in report['resultados']:
+        extra = ''
+        if 'memoria_bytes' in item:
+            extra += f"  memoria {item['memoria_bytes'] / 2 ** 20:.1f} MiB"
+        if 'aceleracion' in item:
+            extra += f"  vectorizado x{item['aceleracion']:.0f} más rápido"
+        if 'error_relativo_max' in item:
+            extra += f"  error máx. {item['error_relativo_max']:.2%}"
+        print(f"{item['filas']:>9} {item['etapa']:<36} {item['mejor_s']:9.4f} s  (mediana {item['mediana_s']:.4f} s){extra}")
+    print(f"Resultados guardados en {output_path}")
+
+    parity_failures = [item for item in report['resultados'] if item.get('diferencias')]
+    for item in parity_failures:
+        print(f"{item['filas']:>9} {item['etapa']}: DIFERENCIAS en {', '.join(item['diferencias'])}")
+    if parity_failures:
+        return 1
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        comparison = compare_results(report, baseline)
+        print(f"\nComparación con {baseline.get('commit')} ({args.comparar}):")
+        for rows, stage, before, after, ratio, regression in comparison:
+            flag = '  <-- REGRESIÓN' if regression else ''
+            print(f"{rows:>9} {stage:<36} {before:9.4f} s -> {after:9.4f} s  x{ratio:.2f}{flag}")
+        if any(item[-1] for item in comparison):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+Gráficas del Dashboard de Productividad del Profesional.
+
+matplotlib y seaborn se importan sólo la primera vez que se dibuja una figura, de modo que
+importar ppl_analytics (o esta misma página) no paga su costo de arranque.
+
+Las figuras se convierten a PNG con figure_to_png, que las cierra enseguida para que el
+registro de figuras de pyplot no crezca en un servidor de larga duración. chart_key da una
+clave estable (datos agregados + estilo) con la que la página cachea la imagen ya dibujada.
+"""
+import hashlib
+import io
+
+# Incrementar al cambiar el estilo o el trazado de cualquier gráfica: invalida las imágenes cacheadas
+CHART_STYLE_VERSION = 3
+# Límites de la evolución de actividades: más allá de ellos se espacian los ticks y se omiten
+# las etiquetas de valor, de modo que el costo de dibujo no crece con la longitud del rango
+MAX_CHART_TICKS = 31
+MAX_ANNOTATED_POINTS = 62
+# Métrica del ranking -> (título, etiqueta del eje Y)
+_RANKING_LABELS = {
+    'pacientes_unicos_total': ('Pacientes Únicos por Profesional (Registro y Auditoría)', 'Número de Pacientes Únicos'),
+    'actividades_totales': ('Actividades Totales por Profesional (Registro y Auditoría)', 'Número de Actividades'),
+}
+# Color de la barra que agrega a los profesionales fuera de la página
+OTHERS_BAR_COLOR = '#9e9e9e'
+# Granularidad -> (adjetivo del título, plural masculino, plural femenino)
+_PERIOD_LABELS = {
+    'Día': ('Diaria', 'Diarios', 'Diarias'),
+    'Semana': ('Semanal', 'Semanales', 'Semanales'),
+    'Mes': ('Mensual', 'Mensuales', 'Mensuales'),
+}
+# Clasificaciones con color propio en el desglose apilado; el resto se agrupa en una sola barra gris
+MAX_STACKED_CLASSIFICATIONS = 10
+# Opciones de guardado equivalentes a las de st.pyplot
+PNG_SAVE_OPTIONS = {'format': 'png', 'dpi': 200, 'bbox_inches': 'tight'}
+
+_PYPLOT = None
+
+
+def _pyplot():
+    """Importa matplotlib.pyplot y aplica el estilo general una sola vez por proceso."""
+    global _PYPLOT
+    if _PYPLOT is None:
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
+        # --- Configuración de Estilo de Gráficas (GENERAL) ---
+        # Este estilo se aplicará a todos los gráficos EXCEPTO al de Evolución Diaria
+        # que tendrá su estilo personalizado.
+        sns.set_style("darkgrid")
+        plt.rcParams['font.size'] = 12
+        plt.rcParams['axes.titlesize'] = 16
+        plt.rcParams['axes.labelsize'] = 14
+        plt.rcParams['xtick.labelsize'] = 10
+        plt.rcParams['ytick.labelsize'] = 10
+        plt.rcParams['legend.fontsize'] = 12
+        _PYPLOT = plt
+    return _PYPLOT
+
+
+def figure_to_png(fig, **savefig_kwargs):
+    """Dibuja la figura como PNG en memoria y la cierra. Retorna los bytes de la imagen."""
+    plt = _pyplot()
+    options = {**PNG_SAVE_OPTIONS, 'facecolor': fig.get_facecolor(), **savefig_kwargs}
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, **options)
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+def chart_key(chart, data, *params):
+    """
+    Clave de la imagen de la gráfica 'chart' dibujada a partir del DataFrame agregado 'data'
+    y de los parámetros adicionales (p. ej. el profesional del título).
+    """
+    import pandas as pd
+
+    digest = hashlib.sha256(f"{chart}|{CHART_STYLE_VERSION}|{params!r}|{list(data.columns)!r}".encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def plot_professional_ranking(summary, metric='pacientes_unicos_total', others=None):
+    """
+    Barras de la métrica por profesional (tabla de summarize_professionals o una página de
+    rank_professionals). 'others' (de others_aggregate) agrega una barra gris con el resto.
+    """
+    plt = _pyplot()
+    from matplotlib import colormaps  # Para usar mapas de color monocromáticos
+
+    # Este gráfico de barras mantiene el estilo "darkgrid" por defecto (global)
+    fig_unified, ax_unified = plt.subplots(figsize=(14, 7))
+
+    # Definir un mapa de color monocromático (ej. 'Greens', 'Blues', 'Purples', 'Oranges')
+    cmap = colormaps['Greens'].resampled(len(summary) + 2)
+    colors = [cmap(i) for i in range(2, cmap.N)]
+
+    labels = summary['Profesional'].astype(str).tolist()
+    values = summary[metric].astype(int).tolist()
+    if others is not None:
+        labels.append(f"Otros ({others['profesionales']})")
+        values.append(int(others[metric]))
+        colors.append(OTHERS_BAR_COLOR)
+
+    bars_unified = ax_unified.bar(labels, values, color=colors)  # Asignar un color diferente a cada barra
+
+    title, y_label = _RANKING_LABELS[metric]
+    ax_unified.set_title(title)
+    ax_unified.set_xlabel('Profesional')
+    ax_unified.set_ylabel(y_label)
+
+    plt.setp(ax_unified.get_xticklabels(), rotation=45, ha='right')
+
+    # Etiquetas de valor de todas las barras en una sola llamada
+    ax_unified.bar_label(bars_unified, labels=[str(value) for value in values], padding=3, fontsize=10)
+
+    ax_unified.set_ylim(bottom=0, top=max(max(values), 1) * 1.15)
+    fig_unified.tight_layout()
+    return fig_unified
+
+
+def plot_daily_activity(daily, professional, granularity='Día'):
+    """
+    Líneas de Registro y Auditoría de un profesional por período. 'daily' es una tabla de
+    daily_activity_counts (o de rollup_activity_counts, con el período como primera columna).
+    """
+    plt = _pyplot()
+    periods = daily[daily.columns[0]]
+    title_adjective, plural_m, plural_f = _PERIOD_LABELS[granularity]
+    annotate = len(daily) <= MAX_ANNOTATED_POINTS
+    fig_daily_detail, ax_daily_detail = plt.subplots(figsize=(14, 7))
+
+    # --- APLICACIÓN DE ESTILO SIMILAR A LA IMAGEN (SOLO PARA ESTE GRÁFICO) ---
+    # Configurar el fondo y la cuadrícula (para imitar la imagen)
+    ax_daily_detail.set_facecolor('white')  # Fondo blanco del área del gráfico
+    fig_daily_detail.patch.set_facecolor('white')  # Fondo blanco de toda la figura
+
+    # Usar cuadrícula solo en el eje Y (horizontal), con líneas punteadas y gris claro
+    ax_daily_detail.grid(True, axis='y', linestyle='--', color='gray', alpha=0.7)
+    ax_daily_detail.grid(False, axis='x')  # Asegurar que no haya cuadrícula vertical
+    # Quitar los bordes del recuadro del gráfico para un aspecto más limpio
+    ax_daily_detail.spines['top'].set_visible(False)
+    ax_daily_detail.spines['right'].set_visible(False)
+    ax_daily_detail.spines['left'].set_color('gray')
+    ax_daily_detail.spines['bottom'].set_color('gray')
+    ax_daily_detail.tick_params(axis='x', colors='black')  # Color de los ticks del eje X
+    ax_daily_detail.tick_params(axis='y', colors='black')  # Color de los ticks del eje Y
+    ax_daily_detail.yaxis.label.set_color('black')  # Color de la etiqueta del eje Y
+    ax_daily_detail.xaxis.label.set_color('black')  # Color de la etiqueta del eje X
+    ax_daily_detail.title.set_color('black')  # Color del título
+    # --- FIN APLICACIÓN DE ESTILO ---
+
+    relevant_columns_for_max = []
+
+    # Usar colores que contrasten bien en fondo blanco
+    color_registro = '#1f77b4'  # Azul estándar de Matplotlib
+    color_auditoria = '#ff7f0e'  # Naranja estándar de Matplotlib
+
+    if 'Registro' in daily.columns:
+        # Trazar la línea de Registro
+        ax_daily_detail.plot(periods, daily['Registro'], marker='o',
+                             linestyle='-', color=color_registro, label=f'Registros {plural_m}', linewidth=2)
+        # Añadir etiquetas de valor en los períodos con actividad de Registro
+        if annotate:
+            _annotate_points(ax_daily_detail, periods, daily['Registro'], y_offset=10)
+        relevant_columns_for_max.append('Registro')
+
+    if 'Auditoría' in daily.columns:
+        # Trazar la línea de Auditoría
+        ax_daily_detail.plot(periods, daily['Auditoría'], marker='x',
+                             linestyle='--', color=color_auditoria, label=f'Auditorías {plural_f}', linewidth=2)
+        # Añadir etiquetas de valor en los períodos con actividad de Auditoría
+        if annotate:
+            _annotate_points(ax_daily_detail, periods, daily['Auditoría'], y_offset=-15)
+        relevant_columns_for_max.append('Auditoría')
+
+    ax_daily_detail.set_title(f'Evolución {title_adjective} de Actividades por {professional}', fontsize=18,
+                              pad=20)  # Título más grande y con padding
+    ax_daily_detail.set_xlabel(f'Período ({granularity})', fontsize=14)
+    ax_daily_detail.set_ylabel(f'Total Actividades {plural_f}', fontsize=14)
+    ax_daily_detail.legend(frameon=False, loc='upper left', fontsize=12)  # Leyenda sin marco y arriba a la izquierda
+
+    # Ticks del eje X en las fechas de los datos, espaciados para no pasar de MAX_CHART_TICKS
+    tick_step = -(-len(periods) // MAX_CHART_TICKS) or 1
+    ax_daily_detail.set_xticks(periods.iloc[::tick_step])
+    fig_daily_detail.autofmt_xdate(rotation=45, ha='right')  # Asegura buena visibilidad de las fechas
+
+    # --- Manejo robusto del límite superior del eje Y ---
+    if relevant_columns_for_max:
+        max_y_value = daily[relevant_columns_for_max].max().max()
+    else:
+        max_y_value = 1  # Valor mínimo si no hay datos en las columnas relevantes
+
+    max_y_value = max(max_y_value, 1)  # Asegura que el límite sea al menos 1
+    ax_daily_detail.set_ylim(bottom=0, top=max_y_value * 1.25)  # Un poco más de espacio para etiquetas
+
+    fig_daily_detail.tight_layout()
+    return fig_daily_detail
+
+
+def plot_classification_breakdown(breakdown, title, x_label):
+    """
+    Barras apiladas de actividades por clasificación de novedad. 'breakdown' es una tabla de
+    classification_breakdown (o de rollup_activity_counts sobre ella): la primera columna da
+    las barras y cada columna restante, de la más a la menos frecuente, es una clasificación.
+    """
+    plt = _pyplot()
+    import numpy as np
+    from matplotlib import colormaps
+
+    labels = breakdown[breakdown.columns[0]].astype(str).tolist()
+    segments = [(str(name), values.to_numpy(), colormaps['tab10'](position))
+                for position, (name, values) in enumerate(breakdown.iloc[:, 1:].items())]
+    # Más allá de MAX_STACKED_CLASSIFICATIONS las clasificaciones menos frecuentes van en "Otras"
+    if len(segments) > MAX_STACKED_CLASSIFICATIONS:
+        rest = sum(values for _, values, _ in segments[MAX_STACKED_CLASSIFICATIONS - 1:])
+        segments = segments[:MAX_STACKED_CLASSIFICATIONS - 1] + [('Otras', rest, OTHERS_BAR_COLOR)]
+    fig, ax = plt.subplots(figsize=(14, 7))
+
+    bottom = np.zeros(len(labels))
+    for name, values, color in segments:
+        ax.bar(labels, values, bottom=bottom, color=color, label=name)
+        bottom += values
+
+    ax.set_title(title)
+    ax.set_xlabel(x_label)
+    ax.set_ylabel('Número de Actividades')
+    # Ticks espaciados para no pasar de MAX_CHART_TICKS (p. ej. evolución diaria en rangos largos)
+    tick_step = -(-len(labels) // MAX_CHART_TICKS) or 1
+    ax.set_xticks(range(0, len(labels), tick_step), labels[::tick_step])
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    ax.legend(title='Clasificación', loc='upper left', bbox_to_anchor=(1.01, 1), fontsize=10, title_fontsize=11)
+    ax.set_ylim(bottom=0, top=max(bottom.max(initial=0), 1) * 1.1)
+    fig.tight_layout()
+    return fig
+
+
+def _annotate_points(ax, dates, values, y_offset):
+    """
+    Etiqueta con su valor los puntos mayores que cero. Los puntos se seleccionan con una máscara
+    sobre los arreglos y se recorren sin indexar la serie punto por punto.
+    """
+    active = (values > 0).to_numpy()
+    for x, y in zip(dates.to_numpy()[active], values.to_numpy()[active].astype(int)):
+        ax.annotate(str(y), (x, y), textcoords="offset points", xytext=(0, y_offset), ha='center', fontsize=9,
+                    color='black')  # Texto en negro para contraste
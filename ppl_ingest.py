@@ -0,0 +1,107 @@
+"""
+Ingesta de archivos subidos en segundo plano.
+
+Cada (archivo, hoja) se lee por bloques, se normaliza y se guarda en la caché de conversión
+(load_prepared_upload) dentro de un pool de hilos, mientras la página consulta el progreso.
+Los trabajos se registran por clave de caché en una cola compartida por el proceso: si el
+navegador se recarga, volver a subir el mismo archivo retoma el trabajo en curso o usa su
+resultado. Cada trabajo mide su propia etapa (tiempo, filas y variación de memoria) para que la
+página la agregue a su perfil al cerrar la ingesta. No depende de Streamlit.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ppl_analytics import load_prepared_upload, prepared_upload_key, upload_cache_path
+from ppl_profiling import StageProfiler
+
+# Archivos que se ingieren a la vez (la lectura del CSV en C y la escritura Parquet liberan el GIL)
+INGEST_WORKERS = 4
+# Trabajos terminados que se conservan en el registro (los más antiguos se descartan)
+MAX_FINISHED_JOBS = 32
+
+
+class IngestJob:
+    """Estado de la ingesta de un archivo (y hoja): progreso, resultado o error."""
+
+    def __init__(self, key, filename, sheet_name):
+        self.key = key
+        self.filename = filename
+        self.sheet_name = sheet_name
+        self.fraction = 0.0
+        self.message = "En cola"
+        self.rows = None
+        self.missing_cols = []
+        self.error = None
+        self.future = None
+        # Etapa 'lectura de <label>' medida en el hilo del trabajo (formato de StageProfiler.stage)
+        self.stage = None
+
+    @property
+    def label(self):
+        return self.filename if self.sheet_name is None else f"{self.filename} (hoja '{self.sheet_name}')"
+
+    @property
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    @property
+    def succeeded(self):
+        return self.done and self.error is None and not self.missing_cols
+
+    def _report_read(self, fraction):
+        # La lectura ocupa la mayor parte del trabajo; el resto es normalizar y guardar en la caché
+        self.fraction = 0.9 * fraction
+        self.message = f"Leyendo ({fraction:.0%})"
+
+    def run(self, file_bytes):
+        self.message = "Leyendo"
+        # La memoria es la del proceso: con varios trabajos a la vez, la variación los incluye a todos
+        profiler = StageProfiler()
+        with profiler.stage(f"lectura de {self.label}") as stage:
+            try:
+                df_loaded, self.missing_cols, _ = load_prepared_upload(file_bytes, self.filename,
+                                                                       self.sheet_name or '',
+                                                                       progress=self._report_read)
+                self.rows = stage['filas'] = len(df_loaded)
+                if not self.missing_cols and not os.path.exists(upload_cache_path(self.key)):
+                    self.error = "No se pudo registrar el archivo en la caché compartida."
+            except Exception as e:
+                self.error = str(e)
+        self.stage = profiler.records[0]
+        self.fraction = 1.0
+        self.message = "Error" if self.error or self.missing_cols else "Listo"
+
+
+class IngestQueue:
+    """Pool de hilos y registro de trabajos por clave de caché, compartido por todas las sesiones."""
+
+    def __init__(self, max_workers=INGEST_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ppl-ingesta')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, file_bytes, filename, sheet_name=None):
+        """
+        Encola la ingesta de un archivo ('sheet_name' sólo aplica a Excel) y retorna su IngestJob.
+        Si el mismo contenido ya está en curso o terminó bien, se retorna ese trabajo.
+        """
+        key = prepared_upload_key(file_bytes, filename, sheet_name or '')
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not (job.done and not job.succeeded):
+                return job
+            job = IngestJob(key, filename, sheet_name)
+            self._jobs[key] = job
+            job.future = self._executor.submit(job.run, file_bytes)
+            self._prune()
+        return job
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def _prune(self):
+        finished = [key for key, job in self._jobs.items() if job.done]
+        for key in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[key]
@@ -0,0 +1,95 @@
+"""
+Instrumentación de las etapas del dashboard: tiempo, filas y variación de memoria por etapa.
+
+Cada ejecución (rerun) de la página usa un StageProfiler; al terminar, su perfil se agrega
+como una línea JSON a PROFILE_LOG_FILE y, si el usuario lo pide, se muestra en el panel
+"Rendimiento" de la barra lateral. No depende de Streamlit.
+"""
+import datetime
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from ppl_analytics import PERSISTED_DATA_DIR
+
+# Registro de perfiles por ejecución (una línea JSON por rerun)
+PROFILE_LOG_FILE = os.path.join(PERSISTED_DATA_DIR, "rendimiento.jsonl")
+# Al superar este tamaño el registro se renombra a .1 y se empieza uno nuevo
+PROFILE_LOG_MAX_BYTES = 20 * 1024 * 1024
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss_bytes():
+    """Memoria residente del proceso en bytes, o None si no se puede leer en esta plataforma."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StageProfiler:
+    """Acumula las mediciones de las etapas con nombre de una ejecución del pipeline."""
+
+    def __init__(self):
+        self.records = []
+        self.started = time.perf_counter()
+        self.finished = False
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Mide el bloque como la etapa 'name'. El dict entregado permite fijar 'filas' dentro
+        del bloque cuando el número de filas sólo se conoce al final de la etapa.
+        """
+        record = {'etapa': name, 'filas': rows}
+        rss_before = current_rss_bytes()
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['segundos'] = time.perf_counter() - started
+            rss_after = current_rss_bytes()
+            record['memoria_delta_mb'] = (None if rss_before is None or rss_after is None
+                                          else (rss_after - rss_before) / 2 ** 20)
+            self.records.append(record)
+
+    def record_stage(self, record):
+        """Agrega una etapa medida fuera de esta ejecución (p. ej. por un hilo de ingesta) con el mismo formato."""
+        self.records.append(dict(record))
+
+    def total_seconds(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        """Perfil de la ejecución listo para serializar: total, memoria final y etapas en orden."""
+        rss = current_rss_bytes()
+        return {
+            'total_s': round(self.total_seconds(), 4),
+            'rss_mb': None if rss is None else round(rss / 2 ** 20, 1),
+            'etapas': [{
+                'etapa': record['etapa'],
+                'segundos': round(record['segundos'], 4),
+                'filas': None if record['filas'] is None else int(record['filas']),
+                'memoria_delta_mb': (None if record['memoria_delta_mb'] is None
+                                     else round(record['memoria_delta_mb'], 2)),
+            } for record in self.records]
+        }
+
+
+def append_profile_log(profile, log_path=PROFILE_LOG_FILE, max_bytes=PROFILE_LOG_MAX_BYTES, **context):
+    """
+    Agrega el perfil (más los campos de 'context', p. ej. la sesión) como una línea JSON.
+    Retorna False si no se pudo escribir; la instrumentación nunca interrumpe la página.
+    """
+    entry = {'fecha': datetime.datetime.now().isoformat(timespec='milliseconds'), **context, **profile}
+    try:
+        if os.path.exists(log_path) and os.path.getsize(log_path) > max_bytes:
+            os.replace(log_path, f"{log_path}.1")
+        with open(log_path, 'a', encoding='utf-8') as log_file:
+            log_file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+        return True
+    except OSError:
+        return False
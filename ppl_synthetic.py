@@ -0,0 +1,125 @@
+"""
+Generador de archivos sintéticos de novedades para pruebas de volumen.
+
+Produce las mismas columnas que el dashboard espera en los archivos reales (CSV o la hoja
+de Excel DEFAULT_SHEET_NAME), con un número configurable de profesionales, pacientes y días
+y una proporción configurable de novedades auditadas.
+
+Uso:
+    python ppl_synthetic.py salida.xlsx --filas 100000 [--profesionales 40] [--pacientes 20000]
+                            [--dias 31] [--auditadas 0.6] [--desde 2025-07-01] [--semilla 0]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from ppl_analytics import DEFAULT_SHEET_NAME, detect_file_format
+
+NOMBRES = ['ANA', 'CARLOS', 'DIANA', 'EDWIN', 'FERNANDA', 'GUSTAVO', 'HELENA', 'IVAN', 'JULIANA', 'LUIS',
+           'MARIA', 'NELSON', 'OLGA', 'PEDRO', 'ROSA', 'SERGIO', 'TATIANA', 'VICTOR', 'YOLANDA', 'JORGE']
+APELLIDOS = ['GARCIA', 'RODRIGUEZ', 'MARTINEZ', 'LOPEZ', 'GONZALEZ', 'PEREZ', 'SANCHEZ', 'RAMIREZ', 'TORRES',
+             'FLOREZ', 'RIVERA', 'GOMEZ', 'DIAZ', 'MORALES', 'VARGAS', 'CASTRO', 'ROJAS', 'MORENO', 'ORTIZ', 'SILVA']
+CLASIFICACIONES = ['CONSULTA MEDICINA GENERAL', 'CONSULTA ODONTOLOGIA', 'CONSULTA PSICOLOGIA', 'REMISION EXTERNA',
+                   'ENTREGA DE MEDICAMENTOS', 'VALORACION DE INGRESO', 'URGENCIAS', 'PROCEDIMIENTO DE ENFERMERIA']
+
+
+def _person_names(rng, count):
+    """Nombres completos distintos 'NOMBRE APELLIDO APELLIDO' para 'count' profesionales."""
+    names = []
+    seen = set()
+    while len(names) < count:
+        name = f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}"
+        if name in seen:
+            name = f"{name} {len(names)}"
+        seen.add(name)
+        names.append(name)
+    return np.array(names, dtype=object)
+
+
+def _skewed_choice(rng, count, size, skew=1.1):
+    """Índices en [0, count) con una distribución tipo Zipf: pocos profesionales concentran la carga."""
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return rng.choice(count, size=size, p=weights / weights.sum())
+
+
+def generate_novedades(rows, professionals=40, patients=None, days=31, audit_share=0.6,
+                       start_date='2025-07-01', seed=0):
+    """
+    DataFrame sintético de novedades con las columnas de los archivos reales.
+
+    - 'professionals' responsables, con carga desigual entre ellos; el auditor de una
+      novedad auditada es siempre un profesional distinto del que la registró.
+    - 'patients' identificaciones distintas (por defecto una por cada tres filas).
+    - Fechas con hora repartidas en 'days' días desde 'start_date', más densas entre semana.
+    - 'audit_share' de las filas tiene RESPONSABLE AUDITORIA; en el resto queda vacío.
+    """
+    rng = np.random.default_rng(seed)
+    patients = patients or max(rows // 3, 1)
+    professional_names = _person_names(rng, professionals)
+
+    registro = _skewed_choice(rng, professionals, rows)
+    auditoria = (registro + rng.integers(1, max(professionals, 2), rows)) % professionals
+    audited = rng.random(rows) < audit_share
+    responsable_auditoria = np.where(audited, professional_names[auditoria], None)
+
+    day_dates = pd.date_range(start_date, periods=days, freq='D')
+    day_weights = np.where(day_dates.dayofweek < 5, 1.0, 0.25)
+    day_offsets = rng.choice(days, size=rows, p=day_weights / day_weights.sum())
+    # Jornada de 7:00 a 18:00
+    seconds = rng.integers(7 * 3600, 18 * 3600, rows)
+    fechas = day_dates[day_offsets] + pd.to_timedelta(seconds, unit='s')
+
+    patient_ids = 10_000_000 + rng.permutation(patients) * 37
+    patient_index = rng.integers(0, patients, rows)
+    first_names = rng.integers(0, len(NOMBRES), patients)
+    last_names = rng.integers(0, len(APELLIDOS), (patients, 2))
+
+    df = pd.DataFrame({
+        'IDENTIFICACIÓN DEL PPL': patient_ids[patient_index].astype(str),
+        'PRIMER NOMBRE': np.array(NOMBRES, dtype=object)[first_names[patient_index]],
+        'SEGUNDO NOMBRE': '',
+        'PRIMER APELLIDO': np.array(APELLIDOS, dtype=object)[last_names[patient_index, 0]],
+        'SEGUNDO APELLIDO': np.array(APELLIDOS, dtype=object)[last_names[patient_index, 1]],
+        'CLASIFICACION DE NOVEDAD': np.array(CLASIFICACIONES, dtype=object)[
+            _skewed_choice(rng, len(CLASIFICACIONES), rows, skew=0.8)],
+        'FECHA DE REGISTRO DE NOVEDAD': fechas,
+        'RESPONSABLE DEL REGISTRO': professional_names[registro],
+        'RESPONSABLE AUDITORIA': responsable_auditoria,
+    })
+    return df.sort_values('FECHA DE REGISTRO DE NOVEDAD', kind='stable').reset_index(drop=True)
+
+
+def write_novedades(df, path, sheet_name=DEFAULT_SHEET_NAME):
+    """Escribe el DataFrame como CSV o como hoja de Excel, según la extensión de 'path'."""
+    if detect_file_format(path, b'') == 'xlsx':
+        df.to_excel(path, sheet_name=sheet_name, index=False, engine='openpyxl')
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un archivo sintético de novedades (CSV o Excel).")
+    parser.add_argument('salida', help="Archivo de salida .csv o .xlsx.")
+    parser.add_argument('--filas', type=int, default=10_000, help="Número de novedades.")
+    parser.add_argument('--profesionales', type=int, default=40, help="Número de profesionales.")
+    parser.add_argument('--pacientes', type=int, default=None, help="Número de pacientes (por defecto filas/3).")
+    parser.add_argument('--dias', type=int, default=31, help="Número de días cubiertos.")
+    parser.add_argument('--auditadas', type=float, default=0.6, help="Proporción de novedades con auditor.")
+    parser.add_argument('--desde', default='2025-07-01', help="Primer día (AAAA-MM-DD).")
+    parser.add_argument('--hoja', default=DEFAULT_SHEET_NAME, help="Hoja de Excel a escribir.")
+    parser.add_argument('--semilla', type=int, default=0, help="Semilla del generador aleatorio.")
+    args = parser.parse_args(argv)
+
+    df = generate_novedades(args.filas, args.profesionales, args.pacientes, args.dias, args.auditadas,
+                            args.desde, args.semilla)
+    write_novedades(df, args.salida, args.hoja)
+    print(f"{len(df)} novedades escritas en {os.path.abspath(args.salida)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
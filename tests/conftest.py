@@ -0,0 +1,39 @@
+"""Fixtures compartidas por las pruebas: meses sintéticos normalizados y comparación de tablas."""
+import pandas as pd
+import pytest
+
+from ppl_analytics import prepare_productivity_frame
+from ppl_synthetic import generate_novedades
+
+
+def _comparable(df):
+    """Categóricos y textos como str, fechas en ns e índice desde 0: se comparan valores, no representaciones."""
+    df = df.reset_index(drop=True)
+    return df.astype({
+        col: 'datetime64[ns]' if pd.api.types.is_datetime64_any_dtype(df[col]) else str
+        for col in df.columns
+        if pd.api.types.is_datetime64_any_dtype(df[col]) or not pd.api.types.is_numeric_dtype(df[col])
+    })
+
+
+@pytest.fixture(scope='session')
+def month_frame():
+    """
+    Fábrica de novedades sintéticas ya normalizadas (prepare_productivity_frame):
+    month_frame(filas, start_date, seed=0, **opciones de generate_novedades). Por defecto
+    abarcan 20 días, de modo que un mes que empieza el día 1 queda en una sola partición.
+    """
+    def make(rows, start_date='2025-07-01', seed=0, days=20, **options):
+        df, missing_cols = prepare_productivity_frame(generate_novedades(rows, start_date=start_date, seed=seed,
+                                                                         days=days, **options))
+        assert not missing_cols
+        return df
+    return make
+
+
+@pytest.fixture(scope='session')
+def assert_same_frame():
+    """Compara dos DataFrames fila por fila sin importar categóricos, resolución de fechas ni índice."""
+    def check(actual, expected):
+        pd.testing.assert_frame_equal(_comparable(actual), _comparable(expected))
+    return check
@@ -0,0 +1,52 @@
+"""Facetas de clasificación calculadas al incorporar cada mes y combinadas al leer."""
+import glob
+import os
+
+import pandas as pd
+
+from ppl_analytics import (CLASSIFICATION_COLUMN, FACET_COLUMNS, PARTITION_COLUMNS, append_to_dataset,
+                           build_classification_facets, dataset_facets_dir, load_dataframe, load_dataset_facets,
+                           load_facets, store_upload_cache, upload_facets_path)
+
+
+def test_partition_facets_follow_incremental_appends(tmp_path, month_frame, assert_same_frame):
+    dataset_dir = str(tmp_path / 'productividad')
+    june = month_frame(2_000, '2025-06-01', seed=1)
+    append_to_dataset(june.iloc[:1_200], dataset_dir)
+    # Segundo archivo del mismo mes: se solapa con el primero y agrega filas nuevas
+    append_to_dataset(june.iloc[800:], dataset_dir)
+    october = month_frame(1_000, '2025-10-01', seed=2)
+    append_to_dataset(october.drop(columns=CLASSIFICATION_COLUMN), dataset_dir)
+
+    assert len(glob.glob(os.path.join(dataset_facets_dir(dataset_dir), '*', '*', '*.parquet'))) == 2
+    assert_same_frame(load_dataset_facets(dataset_dir), build_classification_facets(load_dataframe(dataset_dir)))
+    june_range = (pd.Timestamp('2025-06-10').date(), pd.Timestamp('2025-06-12').date())
+    assert_same_frame(load_dataset_facets(dataset_dir, june_range), build_classification_facets(june))
+
+
+def test_partitions_without_current_facets_are_rebuilt(tmp_path, month_frame, assert_same_frame):
+    dataset_dir = str(tmp_path / 'productividad')
+    # Mes guardado antes de calcular facetas: escrito directamente, sin append_to_dataset
+    june = month_frame(1_500, '2025-06-01', seed=1)
+    june_rows = june.assign(ANIO=june['FECHA DE REGISTRO DE NOVEDAD'].dt.year.astype('int32'),
+                            MES=june['FECHA DE REGISTRO DE NOVEDAD'].dt.month.astype('int32'))
+    june_rows.to_parquet(dataset_dir, partition_cols=PARTITION_COLUMNS, index=False)
+    append_to_dataset(month_frame(700, '2025-06-15', seed=3), dataset_dir)
+    append_to_dataset(month_frame(700, '2025-07-01', seed=4), dataset_dir)
+    assert_same_frame(load_dataset_facets(dataset_dir), build_classification_facets(load_dataframe(dataset_dir)))
+
+    # Un archivo agregado a la partición por fuera de append_to_dataset invalida sus facetas
+    extra = month_frame(300, '2025-07-05', seed=5)
+    extra.to_parquet(os.path.join(dataset_dir, 'ANIO=2025', 'MES=7', 'externo.parquet'), index=False)
+    assert_same_frame(load_dataset_facets(dataset_dir), build_classification_facets(load_dataframe(dataset_dir)))
+    assert len(glob.glob(os.path.join(dataset_facets_dir(dataset_dir), 'ANIO=2025', 'MES=7', '*'))) == 1
+
+
+def test_upload_cache_stores_facets(tmp_path, monkeypatch, month_frame, assert_same_frame):
+    monkeypatch.setattr('ppl_analytics.UPLOAD_CACHE_DIR', str(tmp_path / 'upload_cache'))
+    monkeypatch.setattr('ppl_analytics.FACETS_DIR', str(tmp_path / 'facetas'))
+    df = month_frame(1_000, '2025-06-01')
+    assert store_upload_cache(df, 'clave')
+    facets = load_facets(upload_facets_path('clave'))
+    assert list(facets.columns[:len(FACET_COLUMNS)]) == FACET_COLUMNS
+    assert_same_frame(facets, build_classification_facets(df))
@@ -0,0 +1,63 @@
+"""Resolución temporal de la evolución: agregación por semana ISO o mes y elección automática."""
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ppl_analytics import MAX_EVOLUTION_POINTS, choose_granularity, rollup_activity_counts
+
+
+def _daily(days, registros, auditorias):
+    """Tabla con el formato de daily_activity_counts (sólo los días con actividad)."""
+    daily = pd.DataFrame({'FECHA_DIA': [datetime.date.fromisoformat(day) for day in days],
+                          'Auditoría': auditorias, 'Registro': registros})
+    daily.columns.name = 'Tipo_Actividad'
+    return daily
+
+
+def test_weeks_start_on_iso_monday():
+    daily = _daily(['2025-06-30', '2025-07-06', '2025-07-07', '2025-07-20', '2025-07-28'],
+                   [1, 2, 3, 4, 5], [10, 20, 30, 40, 50])
+    weekly = rollup_activity_counts(daily, 'Semana')
+    # El domingo 2025-07-06 pertenece a la semana del lunes 2025-06-30; la del 2025-07-21 queda en cero
+    assert weekly['SEMANA'].tolist() == [datetime.date(2025, 6, 30), datetime.date(2025, 7, 7),
+                                         datetime.date(2025, 7, 14), datetime.date(2025, 7, 21),
+                                         datetime.date(2025, 7, 28)]
+    assert weekly['Registro'].tolist() == [3, 3, 4, 0, 5]
+    assert weekly['Auditoría'].tolist() == [30, 30, 40, 0, 50]
+
+
+def test_month_bins_sum_daily_counts():
+    rng = np.random.default_rng(0)
+    days = pd.date_range('2025-06-15', '2025-09-10').delete(slice(30, 70))
+    daily = _daily([day.date().isoformat() for day in days], rng.integers(0, 9, len(days)),
+                   rng.integers(0, 9, len(days)))
+    monthly = rollup_activity_counts(daily, 'Mes')
+
+    expected = daily.groupby(pd.to_datetime(daily['FECHA_DIA']).dt.to_period('M'))[['Auditoría', 'Registro']].sum()
+    expected = expected.reindex(pd.period_range('2025-06', '2025-09', freq='M'), fill_value=0)
+    assert monthly['MES'].tolist() == [period.start_time.date() for period in expected.index]
+    assert monthly[['Auditoría', 'Registro']].to_numpy().tolist() == expected.to_numpy().tolist()
+
+
+def test_day_granularity_and_empty_tables_pass_through():
+    daily = _daily(['2025-07-01', '2025-07-03'], [1, 2], [0, 1])
+    assert rollup_activity_counts(daily, 'Día').equals(daily)
+    assert list(rollup_activity_counts(daily.iloc[0:0], 'Mes').columns) == ['MES', 'Auditoría', 'Registro']
+
+
+@pytest.mark.parametrize('days, granularity', [
+    (MAX_EVOLUTION_POINTS, 'Día'),
+    (MAX_EVOLUTION_POINTS + 1, 'Semana'),
+    (7 * (MAX_EVOLUTION_POINTS - 1), 'Semana'),
+    (7 * (MAX_EVOLUTION_POINTS - 1) + 1, 'Mes'),
+])
+def test_automatic_granularity_switches_at_max_points(days, granularity):
+    # Cualquier día de la semana como inicio: el número de puntos nunca supera el máximo
+    for start in pd.date_range('2025-06-30', periods=7):
+        end = start + pd.Timedelta(days=days - 1)
+        assert choose_granularity(start.date(), end.date()) == granularity
+        every_day = pd.date_range(start, end)
+        daily = _daily([day.date().isoformat() for day in every_day], np.ones(days, int), np.zeros(days, int))
+        assert len(rollup_activity_counts(daily, granularity)) <= MAX_EVOLUTION_POINTS
@@ -0,0 +1,84 @@
+"""Resumen aproximado (HyperLogLog) de pacientes únicos frente al resumen exacto."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import ppl_analytics
+from ppl_analytics import (HLL_STANDARD_ERROR, build_activity_cube, build_unified_activity, others_aggregate,
+                           summarize_professionals)
+
+
+def _unified(patients_per_professional, rows_per_professional, days=31, seed=0):
+    """Actividades sintéticas con un rango de pacientes distinto (y parcialmente compartido) por profesional."""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for number, patients in enumerate(patients_per_professional):
+        first_patient = number * patients // 2
+        parts.append(pd.DataFrame({
+            'Profesional': f"PROFESIONAL {number}",
+            'Tipo_Actividad': rng.choice(['Registro', 'Auditoría'], rows_per_professional),
+            'IDENTIFICACIÓN DEL PPL': (first_patient + rng.integers(0, patients, rows_per_professional)).astype(str),
+            'FECHA DE REGISTRO DE NOVEDAD': (pd.Timestamp('2025-07-01')
+                                             + pd.to_timedelta(rng.integers(0, days * 86_400, rows_per_professional),
+                                                               unit='s')),
+        }))
+    return pd.concat(parts, ignore_index=True)
+
+
+def _summaries(unified, start_date, end_date):
+    exact = summarize_professionals(build_activity_cube(unified), start_date, end_date)
+    approximate = summarize_professionals(build_activity_cube(unified, approximate=True), start_date, end_date)
+    pd.testing.assert_series_equal(approximate['Profesional'], exact['Profesional'])
+    pd.testing.assert_series_equal(approximate['actividades_totales'], exact['actividades_totales'])
+    return exact, approximate
+
+
+def _relative_error(approximate, exact):
+    return np.abs(np.asarray(approximate) - np.asarray(exact)) / np.asarray(exact)
+
+
+def test_large_counts_within_three_standard_errors():
+    # Muy por encima de 2,5·2**p pacientes por profesional: se usa la estimación HyperLogLog, no el conteo lineal
+    unified = _unified([6_000, 15_000, 40_000], 80_000)
+    exact, approximate = _summaries(unified, '2025-07-01', '2025-07-31')
+    assert (exact['pacientes_unicos_total'] > 2.5 * 2 ** ppl_analytics.HLL_PRECISION).all()
+    assert (_relative_error(approximate['pacientes_unicos_total'], exact['pacientes_unicos_total'])
+            <= 3 * HLL_STANDARD_ERROR).all()
+
+    professionals = exact['Profesional'].tolist()
+    exact_others = others_aggregate(build_activity_cube(unified), '2025-07-01', '2025-07-31', professionals)
+    approximate_others = others_aggregate(build_activity_cube(unified, approximate=True), '2025-07-01', '2025-07-31',
+                                          professionals)
+    assert (_relative_error(approximate_others['pacientes_unicos_total'], exact_others['pacientes_unicos_total'])
+            <= 3 * HLL_STANDARD_ERROR)
+
+
+def test_synthetic_month_within_three_standard_errors(month_frame):
+    unified = build_unified_activity(month_frame(20_000, patients=8_000))
+    for start_date, end_date in (('2025-07-01', '2025-07-20'), ('2025-07-08', '2025-07-14')):
+        exact, approximate = _summaries(unified, start_date, end_date)
+        assert (_relative_error(approximate['pacientes_unicos_total'], exact['pacientes_unicos_total'])
+                <= 3 * HLL_STANDARD_ERROR).all()
+
+
+def test_estimates_are_clamped_to_activities(monkeypatch):
+    unified = _unified([50, 400], 300)
+    cube = build_activity_cube(unified, approximate=True)
+    estimate = ppl_analytics.hll_estimate
+    # Una sobreestimación exagerada nunca supera las actividades del profesional ni las del grupo
+    monkeypatch.setattr(ppl_analytics, 'hll_estimate', lambda registers: estimate(registers) * 100)
+    summary = summarize_professionals(cube, '2025-07-01', '2025-07-31')
+    assert (summary['pacientes_unicos_total'] == summary['actividades_totales']).all()
+    others = others_aggregate(cube, '2025-07-01', '2025-07-31', summary['Profesional'].tolist())
+    assert others['pacientes_unicos_total'] == others['actividades_totales'] == 600
+
+
+def test_single_patient_on_one_day_is_counted_exactly():
+    # Un solo registro no nulo en el sketch: camino del conteo lineal
+    unified = _unified([1], 5, days=1)
+    assert unified['FECHA DE REGISTRO DE NOVEDAD'].dt.normalize().nunique() == 1
+    exact, approximate = _summaries(unified, '2025-07-01', '2025-07-01')
+    assert exact['pacientes_unicos_total'].tolist() == approximate['pacientes_unicos_total'].tolist() == [1]
+    registers = np.zeros(2 ** ppl_analytics.HLL_PRECISION, dtype=np.uint8)
+    registers[0] = 1
+    assert ppl_analytics.hll_estimate(registers)[0] == pytest.approx(1, rel=1e-3)
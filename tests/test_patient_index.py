@@ -0,0 +1,46 @@
+"""Índice invertido de pacientes sobre el histórico Parquet."""
+import pyarrow.parquet as pq
+import pytest
+
+from ppl_analytics import (append_to_dataset, build_dataset_patient_index, build_patient_index, load_dataframe,
+                           load_patient_index, patient_timeline, save_patient_index, to_arrow_table)
+
+
+@pytest.fixture(scope='module')
+def history(tmp_path_factory, month_frame):
+    """Histórico de tres meses en el conjunto particionado, y el mismo histórico en memoria."""
+    dataset_dir = str(tmp_path_factory.mktemp('historico') / 'productividad')
+    for start_date, seed in (('2025-06-01', 1), ('2025-07-01', 2), ('2025-10-01', 3)):
+        append_to_dataset(month_frame(3_000, start_date, seed, patients=500, days=25), dataset_dir)
+    return dataset_dir, load_dataframe(dataset_dir)
+
+
+@pytest.fixture
+def assert_same_timelines(assert_same_frame):
+    def check(df, reference_index, index):
+        patient_ids = df['IDENTIFICACIÓN DEL PPL'].astype(str).drop_duplicates().sample(40, random_state=0).tolist()
+        for patient_id in patient_ids + ['inexistente']:
+            assert_same_frame(patient_timeline(None, index, patient_id),
+                              patient_timeline(df, reference_index, patient_id))
+    return check
+
+
+def test_dataset_index_matches_in_memory_index(history, assert_same_timelines):
+    dataset_dir, df = history
+    index = build_dataset_patient_index(dataset_dir)
+    assert index['file_rows'].sum() == len(df)
+    assert_same_timelines(df, build_patient_index(df), index)
+
+
+def test_rows_are_read_across_row_groups(history, tmp_path, assert_same_timelines):
+    _, df = history
+    single_file = str(tmp_path / 'productividad.parquet')
+    pq.write_table(to_arrow_table(df), single_file, row_group_size=997)
+    assert_same_timelines(df, build_patient_index(df), build_dataset_patient_index(single_file))
+
+
+def test_saved_dataset_index_round_trips(history, tmp_path, assert_same_timelines):
+    dataset_dir, df = history
+    index_path = str(tmp_path / 'indice.npz')
+    assert save_patient_index(build_dataset_patient_index(dataset_dir), index_path)
+    assert_same_timelines(df, build_patient_index(df), load_patient_index(index_path))
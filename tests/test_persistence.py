@@ -0,0 +1,98 @@
+"""Persistencia del histórico particionado en Parquet."""
+import os
+
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import ppl_analytics
+from ppl_analytics import (DASHBOARD_COLUMNS, PARTITION_COLUMNS, append_to_dataset, build_classification_facets,
+                           load_dataframe, load_dataset_facets, read_date_bounds, upload_cache_key)
+
+
+def test_categorical_columns_are_written_with_int32_indices(tmp_path, month_frame):
+    dataset_dir = str(tmp_path / 'productividad')
+    append_to_dataset(month_frame(150, '2025-06-01', patients=50), dataset_dir)
+    append_to_dataset(month_frame(6_000, '2025-07-01', patients=2_000), dataset_dir)
+
+    for fragment in ds.dataset(dataset_dir, format='parquet').get_fragments():
+        patient_type = pq.read_schema(fragment.path).field('IDENTIFICACIÓN DEL PPL').type
+        assert patient_type.index_type == 'int32'
+    assert len(load_dataframe(dataset_dir, columns=DASHBOARD_COLUMNS)) == 6_150
+    assert len(load_dataframe(dataset_dir, date_range=read_date_bounds(dataset_dir))) == 6_150
+
+
+def test_history_with_mixed_dictionary_widths_loads(tmp_path, month_frame):
+    # Archivos escritos directamente con pandas: int8 en un mes, int16 en el otro
+    dataset_dir = str(tmp_path / 'productividad')
+    for df in (month_frame(150, '2025-06-01', patients=50), month_frame(6_000, '2025-07-01', patients=2_000)):
+        df['ANIO'] = df['FECHA DE REGISTRO DE NOVEDAD'].dt.year.astype('int32')
+        df['MES'] = df['FECHA DE REGISTRO DE NOVEDAD'].dt.month.astype('int32')
+        df.to_parquet(dataset_dir, partition_cols=PARTITION_COLUMNS, index=False)
+
+    assert len(load_dataframe(dataset_dir, columns=DASHBOARD_COLUMNS)) == 6_150
+    assert len(load_dataframe(dataset_dir, date_range=read_date_bounds(dataset_dir))) == 6_150
+    # La deduplicación del mes siguiente también lee las particiones existentes
+    assert len(append_to_dataset(month_frame(100, '2025-07-01', seed=9, patients=80), dataset_dir)) == 100
+    assert len(load_dataframe(dataset_dir)) == 6_250
+
+
+def test_optional_column_missing_from_first_file_is_kept(tmp_path, month_frame):
+    # Los directorios se ordenan como texto: MES=10 (sin clasificación) queda antes que MES=6
+    dataset_dir = str(tmp_path / 'productividad')
+    append_to_dataset(month_frame(300, '2025-06-01', patients=100), dataset_dir)
+    october = month_frame(300, '2025-10-01', seed=3, patients=100)
+    append_to_dataset(october.drop(columns='CLASIFICACION DE NOVEDAD'), dataset_dir)
+
+    june = (pd.Timestamp('2025-06-01').date(), pd.Timestamp('2025-06-30').date())
+    for df in (load_dataframe(dataset_dir, columns=DASHBOARD_COLUMNS),
+               load_dataframe(dataset_dir, columns=DASHBOARD_COLUMNS, date_range=june)):
+        assert 'CLASIFICACION DE NOVEDAD' in df.columns
+        june_rows = df['FECHA DE REGISTRO DE NOVEDAD'].dt.month == 6
+        assert df.loc[june_rows, 'CLASIFICACION DE NOVEDAD'].notna().all()
+        assert df.loc[~june_rows, 'CLASIFICACION DE NOVEDAD'].isna().all()
+
+
+def test_month_exported_again_after_audits_replaces_registered_rows(tmp_path, month_frame, assert_same_frame):
+    dataset_dir = str(tmp_path / 'productividad')
+    registered = month_frame(500, '2025-07-01', seed=4, audit_share=0.0)
+    # Mismo archivo exportado de nuevo: las mismas novedades, ahora con su auditor
+    audited = month_frame(500, '2025-07-01', seed=4, audit_share=1.0)
+    append_to_dataset(month_frame(200, '2025-06-01', seed=5), dataset_dir)
+    append_to_dataset(registered.iloc[:300], dataset_dir)
+    append_to_dataset(registered, dataset_dir)
+
+    assert len(append_to_dataset(audited, dataset_dir)) == 500
+    july = (pd.Timestamp('2025-07-01').date(), pd.Timestamp('2025-07-31').date())
+    stored = load_dataframe(dataset_dir, date_range=july)
+    assert len(stored) == 500
+    assert (stored['RESPONSABLE AUDITORIA'] != '').all()
+    assert len(load_dataframe(dataset_dir)) == 700
+    assert_same_frame(load_dataset_facets(dataset_dir), build_classification_facets(load_dataframe(dataset_dir)))
+
+    # Una vez auditadas, ni la exportación sin auditor ni la auditada vuelven a agregar filas
+    assert append_to_dataset(registered, dataset_dir).empty
+    assert append_to_dataset(audited, dataset_dir).empty
+    assert len(load_dataframe(dataset_dir)) == 700
+
+
+def test_registered_and_audited_copies_in_history_are_collapsed(tmp_path, month_frame):
+    # Histórico escrito cuando el auditor formaba parte de la clave: cada novedad auditada
+    # después quedó dos veces, sin auditor y con él
+    dataset_dir = str(tmp_path / 'productividad')
+    append_to_dataset(month_frame(400, '2025-07-01', seed=6, audit_share=0.0), dataset_dir)
+    audited = month_frame(400, '2025-07-01', seed=6, audit_share=1.0)
+    audited.to_parquet(os.path.join(dataset_dir, 'ANIO=2025', 'MES=7', 'auditadas.parquet'), index=False)
+    assert len(load_dataframe(dataset_dir)) == 800
+
+    # Al incorporar más novedades de julio la partición se depura
+    assert len(append_to_dataset(month_frame(50, '2025-07-25', seed=7, days=5), dataset_dir)) == 50
+    assert len(load_dataframe(dataset_dir)) == 450
+    assert not [name for name in os.listdir(dataset_dir) if name.startswith('.')]
+
+
+def test_upload_cache_key_changes_with_normalization_version(monkeypatch):
+    key = upload_cache_key(b'contenido', 'NOVEDADES JULIO')
+    assert upload_cache_key(b'contenido', 'NOVEDADES JULIO') == key
+    monkeypatch.setattr(ppl_analytics, 'NORMALIZATION_VERSION', ppl_analytics.NORMALIZATION_VERSION + 1)
+    assert upload_cache_key(b'contenido', 'NOVEDADES JULIO') != key
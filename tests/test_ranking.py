@@ -0,0 +1,91 @@
+"""Ranking paginado de profesionales y agregado de los que quedan fuera de la página."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from ppl_analytics import (RANKING_METRICS, build_activity_cube, build_unified_activity, others_aggregate,
+                           rank_professionals, summarize_professionals)
+
+PAGE_SIZE = 7
+
+
+@pytest.fixture(scope='module')
+def summary():
+    """30 profesionales en orden arbitrario, con métricas de pocos valores distintos (muchos empates)."""
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'Profesional': [f"PROFESIONAL {number:02d}" for number in rng.permutation(30)],
+        'pacientes_unicos_total': rng.integers(0, 5, 30),
+        'actividades_totales': rng.integers(0, 8, 30),
+    })
+
+
+def _full_sort(summary, metric, ascending):
+    return summary.sort_values([metric, 'Profesional'], ascending=[ascending, True]).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('ascending', [False, True])
+@pytest.mark.parametrize('metric', list(RANKING_METRICS))
+def test_pages_match_full_sort(summary, metric, ascending):
+    expected = _full_sort(summary, metric, ascending)
+    # Hay empates que cruzan el borde de alguna página, y la última página queda incompleta
+    edges = np.arange(PAGE_SIZE, len(summary), PAGE_SIZE)
+    assert (expected[metric].iloc[edges - 1].to_numpy() == expected[metric].iloc[edges].to_numpy()).any()
+    assert len(summary) % PAGE_SIZE
+
+    pages = []
+    for page in range(-(-len(summary) // PAGE_SIZE)):
+        ranking = rank_professionals(summary, metric, PAGE_SIZE, page, ascending)
+        start = page * PAGE_SIZE
+        assert ranking['Posición'].tolist() == list(range(start + 1, start + len(ranking) + 1))
+        pd.testing.assert_frame_equal(ranking.drop(columns='Posición'),
+                                      expected.iloc[start:start + PAGE_SIZE].reset_index(drop=True))
+        pages.append(ranking)
+    assert len(pages[-1]) == len(summary) % PAGE_SIZE
+    assert pd.concat(pages)['Profesional'].is_unique
+
+
+def test_page_out_of_range_is_empty(summary):
+    ranking = rank_professionals(summary, 'actividades_totales', PAGE_SIZE, page=10)
+    first_page = rank_professionals(summary, 'actividades_totales', PAGE_SIZE)
+    assert ranking.empty
+    pd.testing.assert_series_equal(ranking.dtypes, first_page.dtypes)
+
+
+def _cube(rows):
+    unified = pd.DataFrame(rows, columns=['Profesional', 'Tipo_Actividad', 'IDENTIFICACIÓN DEL PPL', 'FECHA'])
+    unified['FECHA DE REGISTRO DE NOVEDAD'] = pd.to_datetime(unified.pop('FECHA'))
+    return build_activity_cube(unified)
+
+
+def test_others_count_the_union_of_patients():
+    cube = _cube([
+        ('ANA', 'Registro', '101', '2025-07-01 08:00'),
+        ('ANA', 'Auditoría', '102', '2025-07-01 09:00'),
+        ('LUIS', 'Registro', '102', '2025-07-02 10:00'),
+        ('LUIS', 'Registro', '103', '2025-07-03 11:00'),
+        ('MARTA', 'Registro', '104', '2025-07-03 12:00'),
+    ])
+    per_professional = summarize_professionals(cube, '2025-07-01', '2025-07-03', ['ANA', 'LUIS'])
+    assert per_professional['pacientes_unicos_total'].sum() == 4
+
+    others = others_aggregate(cube, '2025-07-01', '2025-07-03', ['ANA', 'LUIS'])
+    # El paciente 102 lo atienden ANA y LUIS: cuenta una sola vez en el grupo
+    assert others == {'profesionales': 2, 'pacientes_unicos_total': 3, 'actividades_totales': 4}
+    assert others_aggregate(cube, '2025-07-01', '2025-07-03', []) is None
+
+
+def test_others_outside_first_page_match_rows(month_frame):
+    unified = build_unified_activity(month_frame(4_000, patients=300))
+    cube = build_activity_cube(unified)
+    summary = summarize_professionals(cube, '2025-07-01', '2025-07-20')
+    shown = rank_professionals(summary, page_size=PAGE_SIZE)['Profesional']
+    rest = summary.loc[~summary['Profesional'].isin(shown), 'Profesional'].tolist()
+
+    others = others_aggregate(cube, '2025-07-01', '2025-07-20', rest)
+    rest_rows = unified[unified['Profesional'].astype(str).isin(rest)]
+    assert others['profesionales'] == len(rest)
+    assert others['actividades_totales'] == len(rest_rows)
+    assert others['pacientes_unicos_total'] == rest_rows['IDENTIFICACIÓN DEL PPL'].nunique()
+    per_professional = summary.loc[summary['Profesional'].isin(rest), 'pacientes_unicos_total']
+    assert others['pacientes_unicos_total'] < per_professional.sum()
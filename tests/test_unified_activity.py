@@ -0,0 +1,47 @@
+"""Equivalencia de build_unified_activity con el recorrido iterrows que reemplazó."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from ppl_analytics import build_unified_activity
+from ppl_benchmark import unified_activity_reference
+
+
+@pytest.fixture
+def assert_matches_reference(assert_same_frame):
+    def check(df):
+        assert_same_frame(build_unified_activity(df), unified_activity_reference(df))
+    return check
+
+
+def _raw_novedades():
+    """Novedades sin normalizar, con responsables vacíos, None y NaN en ambas columnas."""
+    return pd.DataFrame({
+        'IDENTIFICACIÓN DEL PPL': ['101', '102', '103', '104', '105', '106'],
+        'FECHA DE REGISTRO DE NOVEDAD': pd.to_datetime(['2025-07-01 08:00', '2025-07-01 09:30', '2025-07-02 10:00',
+                                                        '2025-07-02 11:00', '2025-07-03 12:00', '2025-07-03 15:00']),
+        'RESPONSABLE DEL REGISTRO': ['ANA', '', None, 'LUIS', np.nan, 'ANA'],
+        'RESPONSABLE AUDITORIA': ['LUIS', 'ANA', 'LUIS', '', None, np.nan],
+    })
+
+
+def test_matches_reference_with_empty_and_missing_responsables(assert_matches_reference):
+    assert_matches_reference(_raw_novedades())
+
+
+def test_matches_reference_without_audit_column(assert_matches_reference):
+    assert_matches_reference(_raw_novedades().drop(columns='RESPONSABLE AUDITORIA'))
+
+
+def test_matches_reference_when_no_responsables():
+    df = _raw_novedades()
+    df['RESPONSABLE DEL REGISTRO'] = ''
+    df['RESPONSABLE AUDITORIA'] = np.nan
+    assert build_unified_activity(df).empty
+    assert unified_activity_reference(df).empty
+
+
+@pytest.mark.parametrize('audit_share', [0.0, 0.6, 1.0])
+def test_matches_reference_on_normalized_data(audit_share, month_frame, assert_matches_reference):
+    # Esquema canónico (categóricos, vacíos como ''), igual que lo recibe la página
+    assert_matches_reference(month_frame(2_000, professionals=12, days=31, audit_share=audit_share))
@@ -0,0 +1,96 @@
+"""Lectura por bloques de archivos subidos frente a una sola lectura con pd.read_csv / pd.read_excel."""
+import datetime
+import io
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from ppl_analytics import UPLOAD_CHUNK_ROWS, load_uploaded_data
+
+SHEET = 'NOVEDADES JULIO'
+# Suficientes filas para leer el archivo en dos bloques
+ROWS = UPLOAD_CHUNK_ROWS + 1_000
+HEADER = ['IDENTIFICACIÓN DEL PPL', 'FECHA DE REGISTRO DE NOVEDAD', 'RESPONSABLE DEL REGISTRO',
+          'RESPONSABLE AUDITORIA', 'LOTE', 'PUNTAJE']
+
+
+def _read_csv(file_bytes):
+    return pd.read_csv(io.BytesIO(file_bytes), encoding='utf-8', encoding_errors='ignore', on_bad_lines='skip')
+
+
+def _load_in_chunks(file_bytes, filename, sheet_name=SHEET):
+    """load_uploaded_data, comprobando que el archivo se leyó en más de un bloque."""
+    fractions = []
+    df_loaded = load_uploaded_data(file_bytes, filename, sheet_name, progress=fractions.append)
+    assert len(fractions) > 1
+    return df_loaded
+
+
+def _workbook_bytes(sheets):
+    """Libro .xlsx con las hojas {nombre: filas}; las listas vacías quedan como filas vacías."""
+    workbook = Workbook(write_only=True)
+    for name, rows in sheets.items():
+        sheet = workbook.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def _novedades_rows():
+    rng = np.random.default_rng(0)
+    for number in range(ROWS):
+        yield [f"{10_000_000 + rng.integers(0, 5_000)}",
+               datetime.datetime(2025, 7, 1) + datetime.timedelta(minutes=int(rng.integers(0, 44_640))),
+               f"PROFESIONAL {number % 13}",
+               None if number % 3 == 0 else f"PROFESIONAL {number % 7}",
+               # Numérica en el primer bloque y con texto en los siguientes
+               str(number) if number < UPLOAD_CHUNK_ROWS else f"LOTE {number}",
+               None if number % 11 == 0 else float(number % 5)]
+
+
+@pytest.fixture(scope='module')
+def small_xlsx_bytes():
+    return _workbook_bytes({SHEET: [HEADER, *list(_novedades_rows())[:10]], 'OTRA': [['SIN DATOS']]})
+
+
+def test_csv_chunks_match_single_read():
+    csv_bytes = pd.DataFrame(list(_novedades_rows()), columns=HEADER).to_csv(index=False).encode('utf-8')
+    expected = _read_csv(csv_bytes)
+    pd.testing.assert_frame_equal(_load_in_chunks(csv_bytes, 'novedades.csv'), expected)
+    assert pd.api.types.is_integer_dtype(expected['IDENTIFICACIÓN DEL PPL'])
+    assert not pd.api.types.is_numeric_dtype(expected['LOTE'])
+
+
+def test_header_only_csv_matches_single_read():
+    csv_bytes = (','.join(HEADER) + '\n').encode('utf-8')
+    pd.testing.assert_frame_equal(load_uploaded_data(csv_bytes, 'novedades.csv'), _read_csv(csv_bytes))
+
+
+def test_xlsx_chunks_match_single_read():
+    # Filas vacías intermedias (también en el borde de un bloque) y al final de la hoja
+    rows = [HEADER]
+    for number, row in enumerate(_novedades_rows()):
+        if number in (5, 6, UPLOAD_CHUNK_ROWS - 1, UPLOAD_CHUNK_ROWS):
+            rows.append([])
+        rows.append(row)
+    xlsx_bytes = _workbook_bytes({SHEET: rows + [[]] * 3})
+    expected = pd.read_excel(io.BytesIO(xlsx_bytes), sheet_name=SHEET)
+    assert len(expected) == ROWS + 4
+    pd.testing.assert_frame_equal(_load_in_chunks(xlsx_bytes, 'novedades.xlsx'), expected)
+
+
+def test_header_only_sheet_matches_single_read(small_xlsx_bytes):
+    pd.testing.assert_frame_equal(load_uploaded_data(small_xlsx_bytes, 'novedades.xlsx', 'OTRA'),
+                                  pd.read_excel(io.BytesIO(small_xlsx_bytes), sheet_name='OTRA'))
+
+
+def test_missing_sheet_raises_like_read_excel(small_xlsx_bytes):
+    with pytest.raises(ValueError) as expected:
+        pd.read_excel(io.BytesIO(small_xlsx_bytes), sheet_name='NOVEDADES AGOSTO')
+    with pytest.raises(ValueError, match=re.escape(str(expected.value))):
+        load_uploaded_data(small_xlsx_bytes, 'novedades.xlsx', 'NOVEDADES AGOSTO')